@@ -0,0 +1,11 @@
+import os
+from typing import Optional
+
+# Snapshot of the process environment taken once at import time. This is a batch system that
+# reads its configuration at startup, so later os.environ mutations are intentionally not seen.
+_SNAPSHOT: dict[str, str] = dict(os.environ)
+
+
+def env(key: str, default: Optional[str] = None) -> Optional[str]:
+    """Return `key` from the startup environment snapshot (like os.environ.get)."""
+    return _SNAPSHOT.get(key, default)
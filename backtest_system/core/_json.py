@@ -0,0 +1,28 @@
+# JSON helpers backed by orjson when installed, with a stdlib fallback.
+import json
+
+try:
+    import orjson
+except ImportError:  # optional speedup; fall back to the stdlib encoder/decoder
+    orjson = None
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def dumps_bytes(obj, *, default=None) -> bytes:
+    """Serialize to UTF-8 JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=default, option=_OPTIONS)
+    return json.dumps(obj, default=default, ensure_ascii=False).encode("utf-8")
+
+
+def dumps(obj, *, default=None) -> str:
+    """Serialize to a JSON str."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=default, option=_OPTIONS).decode("utf-8")
+    return json.dumps(obj, default=default, ensure_ascii=False)
+
+
+def loads(data: bytes | str):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
@@ -1,38 +1,41 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-import os
+import sys
 from pathlib import Path
 from typing import Any, Optional
 
-import yaml
-
+from backtest_system.core._envcache import env
 from backtest_system.core.exceptions import ConfigurationError
 
+# Parsed YAML roots keyed by (resolved path, mtime_ns, size) so repeated loads skip re-parsing
+# while still picking up edits. Entries are treated as read-only.
+_FILE_CFG_CACHE: dict[tuple[str, int, int], dict] = {}
+
+
+_TRUE_STRINGS = frozenset({"1", "true", "yes", "y", "on"})
+_FALSE_STRINGS = frozenset({"0", "false", "no", "n", "off"})
+
 
 def _as_bool(value: object, *, default: bool) -> bool:
     if value is None:
         return default
     if isinstance(value, bool):
         return value
-    s = str(value).strip().lower()
-    if s in {"1", "true", "yes", "y", "on"}:
+    s = (value if isinstance(value, str) else str(value)).strip().lower()
+    if s in _TRUE_STRINGS:
         return True
-    if s in {"0", "false", "no", "n", "off"}:
+    if s in _FALSE_STRINGS:
         return False
     return default
 
 
-def _get(d: dict, path: str, default: Any = None) -> Any:
-    cur: Any = d
-    for part in path.split("."):
-        if not isinstance(cur, dict) or part not in cur:
-            return default
-        cur = cur[part]
-    return cur
+def _section(d: dict, name: str) -> dict:
+    sub = d.get(name)
+    return sub if isinstance(sub, dict) else {}
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class ApiConfig:
     read_url: str
     write_url: str
@@ -43,31 +46,68 @@ class ApiConfig:
     trust_env: bool = False
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class DatabaseConfig:
     url: Optional[str] = None
+    # Max pooled connections for concurrent direct-SQL reads (web API); 0 = one shared connection.
+    pool_size: int = 10
+    # Insert task logs straight into task_logs over url instead of posting them to the log API.
+    # Only for deployments where url is the same database the write API fills.
+    direct_log_writes: bool = False
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class AppConfig:
     output_dir: str = "output"
     non_interactive: bool = True
     on_escalate: str = "halt"  # halt | retry | skip
+    # Internal nginx location serving output_dir; when set, report downloads are handed to nginx
+    # via X-Accel-Redirect instead of being streamed by the web worker.
+    report_xaccel_prefix: str = ""
+
+    def __post_init__(self):
+        # Tiny fixed vocabulary: share one string object across instances.
+        object.__setattr__(self, "on_escalate", sys.intern(self.on_escalate))
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class BacktestConfig:
     database: DatabaseConfig
     api: ApiConfig
     app: AppConfig
 
 
+def _read_config_file(path: str) -> dict:
+    p = Path(path)
+    try:
+        st = p.stat()
+    except FileNotFoundError:
+        raise ConfigurationError(f"Config file not found: {path}")
+    key = (str(p.resolve()), st.st_mtime_ns, st.st_size)
+    cached = _FILE_CFG_CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    # Imported lazily: env-only configurations never need PyYAML. Prefer the libyaml-backed
+    # loader when PyYAML was built with it; same safe semantics.
+    import yaml
+
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    file_cfg = yaml.load(p.read_bytes(), Loader=loader) or {}
+    if not isinstance(file_cfg, dict):
+        raise ConfigurationError("Config file root must be a YAML mapping/object")
+    _FILE_CFG_CACHE[key] = file_cfg
+    return file_cfg
+
+
 def load_config(path: str | None = None) -> BacktestConfig:
     """
     Load configuration from an optional YAML file, then override with env vars.
 
-    Env vars (highest priority):
+    Env vars (highest priority; snapshotted at process start, so later os.environ edits are ignored):
       - BACKTEST_DB_URL
+      - BACKTEST_DB_POOL_SIZE
+      - BACKTEST_DB_DIRECT_LOGS
       - BACKTEST_API_READ_URL
       - BACKTEST_API_WRITE_URL
       - BACKTEST_API_TOKEN
@@ -76,43 +116,52 @@ def load_config(path: str | None = None) -> BacktestConfig:
       - BACKTEST_OUTPUT_DIR
       - BACKTEST_NON_INTERACTIVE
       - BACKTEST_ON_ESCALATE   (halt|retry|skip)
+      - BACKTEST_REPORT_XACCEL_PREFIX
     """
     file_cfg: dict[str, Any] = {}
     if path:
-        p = Path(path)
-        if not p.exists():
-            raise ConfigurationError(f"Config file not found: {path}")
-        file_cfg = yaml.safe_load(p.read_text(encoding="utf-8")) or {}
-        if not isinstance(file_cfg, dict):
-            raise ConfigurationError("Config file root must be a YAML mapping/object")
+        file_cfg = _read_config_file(path)
 
     # Defaults (safe/no-secrets).
-    db_url = _get(file_cfg, "database.url", None)
-    api_read_url = _get(file_cfg, "api.read_url", "http://localhost:8000")
-    api_write_url = _get(file_cfg, "api.write_url", "http://localhost:8000")
-    api_token = _get(file_cfg, "api.token", "")
-    api_timeout = int(_get(file_cfg, "api.timeout_seconds", 30) or 30)
-    api_trust_env = _as_bool(_get(file_cfg, "api.trust_env", False), default=False)
-    output_dir = _get(file_cfg, "app.output_dir", "output")
-    non_interactive = _as_bool(_get(file_cfg, "app.non_interactive", True), default=True)
-    on_escalate = str(_get(file_cfg, "app.on_escalate", "halt") or "halt").strip().lower()
-
-    # Env overrides.
-    db_url = os.getenv("BACKTEST_DB_URL", db_url or None)
-    api_read_url = os.getenv("BACKTEST_API_READ_URL", api_read_url)
-    api_write_url = os.getenv("BACKTEST_API_WRITE_URL", api_write_url)
-    api_token = os.getenv("BACKTEST_API_TOKEN", api_token)
-    api_timeout = int(os.getenv("BACKTEST_API_TIMEOUT_SECONDS", str(api_timeout)))
-    api_trust_env = _as_bool(os.getenv("BACKTEST_API_TRUST_ENV", api_trust_env), default=False)
-    output_dir = os.getenv("BACKTEST_OUTPUT_DIR", output_dir)
-    non_interactive = _as_bool(os.getenv("BACKTEST_NON_INTERACTIVE", non_interactive), default=True)
-    on_escalate = os.getenv("BACKTEST_ON_ESCALATE", on_escalate).strip().lower()
+    db_cfg = _section(file_cfg, "database")
+    api_cfg = _section(file_cfg, "api")
+    app_cfg = _section(file_cfg, "app")
+    db_url = db_cfg.get("url")
+    db_pool_size = int(db_cfg.get("pool_size", 10) or 0)
+    db_direct_logs = _as_bool(db_cfg.get("direct_log_writes", False), default=False)
+    api_read_url = api_cfg.get("read_url", "http://localhost:8000")
+    api_write_url = api_cfg.get("write_url", "http://localhost:8000")
+    api_token = api_cfg.get("token", "")
+    api_timeout = int(api_cfg.get("timeout_seconds", 30) or 30)
+    api_trust_env = _as_bool(api_cfg.get("trust_env", False), default=False)
+    output_dir = app_cfg.get("output_dir", "output")
+    non_interactive = _as_bool(app_cfg.get("non_interactive", True), default=True)
+    on_escalate = str(app_cfg.get("on_escalate", "halt") or "halt").strip().lower()
+    report_xaccel_prefix = str(app_cfg.get("report_xaccel_prefix", "") or "")
+
+    # Env overrides, read from the startup snapshot (see core/_envcache.py).
+    db_url = env("BACKTEST_DB_URL", db_url or None)
+    env_pool_size = env("BACKTEST_DB_POOL_SIZE")
+    if env_pool_size is not None:
+        db_pool_size = int(env_pool_size)
+    db_direct_logs = _as_bool(env("BACKTEST_DB_DIRECT_LOGS", db_direct_logs), default=False)
+    api_read_url = env("BACKTEST_API_READ_URL", api_read_url)
+    api_write_url = env("BACKTEST_API_WRITE_URL", api_write_url)
+    api_token = env("BACKTEST_API_TOKEN", api_token)
+    env_timeout = env("BACKTEST_API_TIMEOUT_SECONDS")
+    if env_timeout is not None:
+        api_timeout = int(env_timeout)
+    api_trust_env = _as_bool(env("BACKTEST_API_TRUST_ENV", api_trust_env), default=False)
+    output_dir = env("BACKTEST_OUTPUT_DIR", output_dir)
+    non_interactive = _as_bool(env("BACKTEST_NON_INTERACTIVE", non_interactive), default=True)
+    on_escalate = env("BACKTEST_ON_ESCALATE", on_escalate).strip().lower()
+    report_xaccel_prefix = env("BACKTEST_REPORT_XACCEL_PREFIX", report_xaccel_prefix).strip().rstrip("/")
 
     if on_escalate not in {"halt", "retry", "skip"}:
         raise ConfigurationError("BACKTEST_ON_ESCALATE must be one of: halt, retry, skip")
 
     return BacktestConfig(
-        database=DatabaseConfig(url=db_url),
+        database=DatabaseConfig(url=db_url, pool_size=max(0, db_pool_size), direct_log_writes=db_direct_logs),
         api=ApiConfig(
             read_url=api_read_url.rstrip("/"),
             write_url=api_write_url.rstrip("/"),
@@ -124,5 +173,6 @@ def load_config(path: str | None = None) -> BacktestConfig:
             output_dir=output_dir,
             non_interactive=non_interactive,
             on_escalate=on_escalate,
+            report_xaccel_prefix=report_xaccel_prefix,
         ),
     )
@@ -1,14 +1,201 @@
-import psycopg2
-from psycopg2.extras import RealDictCursor
-from psycopg2 import sql
-from typing import Optional
+from typing import TYPE_CHECKING, Iterator, Optional
+import hashlib
+import logging
+import os
+import threading
+import time
+import uuid
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from collections import OrderedDict
-from datetime import date, timedelta
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from functools import lru_cache
 
+from backtest_system.core import _json
 from backtest_system.core.config import ApiConfig
 from backtest_system.core.exceptions import ConfigurationError, ModuleError, NetworkError
 
+logger = logging.getLogger(__name__)
+
+# psycopg2 is imported on first direct-SQL use (connect / SQL builders), so HTTP-only runs and
+# strategy worker processes never pay its import cost.
+if TYPE_CHECKING:
+    from psycopg2 import sql
+
+
+@lru_cache(maxsize=128)
+def _build_insert(table: str, cols: tuple[str, ...]) -> "sql.Composed":
+    from psycopg2 import sql
+
+    return sql.SQL("INSERT INTO {table} ({cols}) VALUES ({vals}) RETURNING id").format(
+        table=sql.Identifier(table),
+        cols=sql.SQL(", ").join(sql.Identifier(c) for c in cols),
+        vals=sql.SQL(", ").join(sql.Placeholder() for _ in cols),
+    )
+
+
+@lru_cache(maxsize=128)
+def _build_insert_values(table: str, cols: tuple[str, ...]) -> "sql.Composed":
+    from psycopg2 import sql
+
+    # Single %s placeholder expanded by execute_values.
+    return sql.SQL("INSERT INTO {table} ({cols}) VALUES %s RETURNING id").format(
+        table=sql.Identifier(table),
+        cols=sql.SQL(", ").join(sql.Identifier(c) for c in cols),
+    )
+
+
+@lru_cache(maxsize=128)
+def _build_update(table: str, set_cols: tuple[str, ...], where_cols: tuple[str, ...]) -> "sql.Composed":
+    from psycopg2 import sql
+
+    set_clause = sql.SQL(", ").join(
+        sql.SQL("{} = {}").format(sql.Identifier(k), sql.Placeholder()) for k in set_cols
+    )
+    where_clause = sql.SQL(" AND ").join(
+        sql.SQL("{} = {}").format(sql.Identifier(k), sql.Placeholder()) for k in where_cols
+    )
+    return sql.SQL("UPDATE {table} SET {set_clause} WHERE {where_clause}").format(
+        table=sql.Identifier(table),
+        set_clause=set_clause,
+        where_clause=where_clause,
+    )
+
+
+class _ResponseCache:
+    """
+    LRU + TTL cache for read-only API payloads.
+
+    Tier 1 is an in-process OrderedDict; tier 2 (optional) is one JSON file per key under
+    `cache_dir` (plain data only, never unpickled), so a later run within the TTL can skip the network entirely. Expired entries
+    are kept (until evicted) together with their HTTP validators (ETag / Last-Modified) so the
+    caller can revalidate them with a conditional request.
+
+    The disk tier is bounded too: files not rewritten within `stale_seconds` (past any useful
+    revalidation) are pruned, at most `max_files` are kept, and a file whose entry is evicted
+    from memory after expiring without validators is removed right away.
+    """
+
+    def __init__(
+        self,
+        *,
+        maxsize: int = 64,
+        ttl_seconds: float = 300.0,
+        cache_dir: str | None = None,
+        stale_seconds: float = 86400.0,
+        max_files: int = 1024,
+    ):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self.cache_dir = cache_dir
+        self.stale_seconds = max(stale_seconds, ttl_seconds)
+        self.max_files = max_files
+        self._entries: "OrderedDict[tuple, tuple[float, list[dict], dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_prune = 0.0
+
+    def _path(self, key: tuple) -> str:
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.json")
+
+    def _lookup(self, key: tuple) -> Optional[tuple[float, list[dict], dict]]:
+        with self._lock:
+            try:
+                entry = self._entries[key]
+            except KeyError:
+                pass
+            else:
+                self._entries.move_to_end(key)
+                return entry
+
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._path(key), "rb") as f:
+                doc = _json.loads(f.read())
+            inserted_at, value, validators = float(doc["inserted_at"]), doc["data"], doc["validators"]
+            if not isinstance(value, list) or not isinstance(validators, dict):
+                return None
+        except Exception:
+            return None
+        self._remember(key, (inserted_at, value, validators))
+        return inserted_at, value, validators
+
+    def get(self, key: tuple) -> Optional[list[dict]]:
+        """Return the cached value if it is still within the TTL."""
+        entry = self._lookup(key)
+        if entry is None or time.time() - entry[0] > self.ttl_seconds:
+            return None
+        return entry[1]
+
+    def get_stale(self, key: tuple) -> Optional[tuple[list[dict], dict]]:
+        """Return (value, validators) for an entry that can be revalidated, regardless of age."""
+        entry = self._lookup(key)
+        if entry is None or not entry[2]:
+            return None
+        return entry[1], entry[2]
+
+    def put(self, key: tuple, value: list[dict], validators: dict | None = None) -> None:
+        entry = (time.time(), value, validators or {})
+        self._remember(key, entry)
+        if not self.cache_dir:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp = f"{self._path(key)}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(_json.dumps_bytes({"inserted_at": entry[0], "data": value, "validators": entry[2]}))
+            os.replace(tmp, self._path(key))
+        except Exception:
+            # Disk cache is best-effort.
+            pass
+        self._prune_disk()
+
+    def _remember(self, key: tuple, entry: tuple[float, list[dict], dict]) -> None:
+        evicted = []
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                evicted.append(self._entries.popitem(last=False))
+        if not self.cache_dir:
+            return
+        now = time.time()
+        for old_key, (inserted_at, _, validators) in evicted:
+            # Expired and nothing to revalidate with: the file can never be served again.
+            if not validators and now - inserted_at > self.ttl_seconds:
+                self._unlink(self._path(old_key))
+
+    def _prune_disk(self) -> None:
+        """删除过期的磁盘缓存文件，并把文件数控制在 max_files 以内（最多每个 TTL 周期扫描一次）"""
+        now = time.time()
+        with self._lock:
+            if now - self._last_prune < self.ttl_seconds:
+                return
+            self._last_prune = now
+        try:
+            with os.scandir(self.cache_dir) as it:
+                files = [(e.stat().st_mtime, e.path) for e in it if e.is_file()]
+        except OSError:
+            return
+        # put() rewrites the file on every store/revalidation, so mtime is the last time it was used.
+        files.sort(reverse=True)
+        for i, (mtime, path) in enumerate(files):
+            # .pickle files are from the former disk format and are never read back.
+            if i >= self.max_files or now - mtime > self.stale_seconds or path.endswith(".pickle"):
+                self._unlink(path)
+
+    @staticmethod
+    def _unlink(path: str) -> None:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
 class DatabaseAPI:
     """
     数据/任务/日志访问层。
@@ -18,34 +205,160 @@ class DatabaseAPI:
     - 历史查询/部分更新：可选直连 Postgres（db_url）
     """
 
-    def __init__(self, db_url: Optional[str], api: ApiConfig):
+    def __init__(
+        self,
+        db_url: Optional[str],
+        api: ApiConfig,
+        *,
+        cache_dir: str | None = None,
+        cache_ttl_seconds: float = 300.0,
+        pool_size: int = 0,
+        direct_log_writes: bool = False,
+    ):
         self.connection_string = db_url
+        # Logs go to the log API like tasks and results unless direct SQL writes are enabled explicitly.
+        self.direct_log_writes = bool(direct_log_writes and db_url)
         self.api = api
         self._conn = None
+        self._conn_lock = threading.Lock()
+        # Direct log writes run on the supervisor's flusher thread; they get a connection of their own
+        # (serialized by _log_lock) so their transactions never interleave with those on connect().
+        self._log_conn = None
+        self._log_lock = threading.Lock()
+        # pool_size > 0: read() checks out its own connection from a pool of at most pool_size, so
+        # concurrent callers (web handlers) don't queue on one connection. Writes/transactions and
+        # pool_size == 0 use the single connection from connect().
+        self.pool_size = max(0, int(pool_size))
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        # ThreadedConnectionPool raises when exhausted; callers wait for a free slot instead.
+        self._pool_slots = threading.BoundedSemaphore(self.pool_size) if self.pool_size else None
         self._session = requests.Session()
         # Avoid surprising failures when the environment exports a global proxy
         # (common on dev laptops). Can be enabled via BACKTEST_API_TRUST_ENV=true.
         self._session.trust_env = bool(getattr(api, "trust_env", False))
-        # Small in-memory cache to reduce repeat API calls during retries.
-        self._continuous_cache: "OrderedDict[tuple, list[dict]]" = OrderedDict()
-        self._continuous_cache_max = 64
-
-    def connect(self):
+        # Keep-alive pool sized for bursts of market-data reads; transient gateway errors on
+        # idempotent GETs are retried at the transport layer. Read timeouts are not retried here
+        # so get_continuous can fall back to chunked fetches without waiting out extra attempts.
+        adapter = HTTPAdapter(
+            pool_connections=32,
+            pool_maxsize=32,
+            max_retries=Retry(
+                total=3,
+                read=0,
+                backoff_factor=0.3,
+                status_forcelist=(502, 503, 504),
+                allowed_methods=frozenset({"GET"}),
+                raise_on_status=False,
+            ),
+        )
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        # ApiConfig is frozen, so the auth headers can be set once as session defaults.
+        self._session.headers["Accept"] = "application/json"
+        if api.token:
+            self._session.headers["Authorization"] = f"Bearer {api.token}"
+        # Market-data reads are cached (memory LRU, optionally on disk) with a short TTL to
+        # reduce repeat API calls during retries and across runs.
+        self.cache_dir = cache_dir
+        self._read_cache = _ResponseCache(maxsize=64, ttl_seconds=cache_ttl_seconds, cache_dir=cache_dir)
+        # Write endpoints are fixed for the lifetime of this (frozen) ApiConfig.
+        self._log_url = f"{api.write_url}/api/backtest/log"
+        self._task_url = f"{api.write_url}/api/backtest/task"
+        self._result_url = f"{api.write_url}/api/backtest/result"
+
+    def _require_db_url(self) -> None:
         if not self.connection_string:
             raise ConfigurationError("Missing BACKTEST_DB_URL (required for direct SQL reads/writes)")
-        if self._conn is None or self._conn.closed:
-            self._conn = psycopg2.connect(self.connection_string)
-        return self._conn
 
-    def close(self):
-        if self._conn and not self._conn.closed:
-            self._conn.close()
+    def _open_conn(self):
+        import psycopg2
 
-    def _api_headers(self):
-        headers = {"Accept": "application/json"}
-        if self.api.token:
-            headers["Authorization"] = f"Bearer {self.api.token}"
-        return headers
+        conn = psycopg2.connect(self.connection_string)
+        # Explicit transactions: writes commit once per transaction(), not per statement.
+        conn.set_session(autocommit=False)
+        return conn
+
+    def connect(self):
+        self._require_db_url()
+        # Locked so two threads racing on first use don't each open (and one leak) a connection.
+        with self._conn_lock:
+            if self._conn is None or self._conn.closed:
+                self._conn = self._open_conn()
+            return self._conn
+
+    @contextmanager
+    def transaction(self):
+        """
+        单事务内执行多次写入：yield 游标，正常退出时提交一次，异常时回滚。
+
+            with db_api.transaction() as cur:
+                db_api.write("t", row_a, cursor=cur)
+                db_api.update_where("t", data, where, cursor=cur)
+        """
+        with self._transaction_on(self.connect()) as cur:
+            yield cur
+
+    @contextmanager
+    def _transaction_on(self, conn):
+        try:
+            with conn.cursor() as cur:
+                yield cur
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    @contextmanager
+    def _write_cursor(self, cursor):
+        # Reuse the caller's transaction cursor (no commit), or run in a transaction of our own.
+        if cursor is not None:
+            yield cursor
+            return
+        with self.transaction() as cur:
+            yield cur
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                from psycopg2.pool import ThreadedConnectionPool
+
+                self._pool = ThreadedConnectionPool(1, self.pool_size, self.connection_string)
+            return self._pool
+
+    @contextmanager
+    def _read_conn(self):
+        """read() 使用的连接：有连接池时借出/归还池内连接，否则为 connect() 的共享连接"""
+        self._require_db_url()
+        if self._pool_slots is None:
+            yield self.connect()
+            return
+        with self._pool_slots:
+            pool = self._get_pool()
+            conn = pool.getconn()
+            broken = False
+            try:
+                yield conn
+            finally:
+                # End the read transaction so the connection goes back idle, not "idle in transaction".
+                try:
+                    if not conn.closed:
+                        conn.rollback()
+                except Exception:
+                    broken = True
+                pool.putconn(conn, close=broken or bool(conn.closed))
+
+    def close(self):
+        with self._conn_lock:
+            if self._conn and not self._conn.closed:
+                self._conn.close()
+        with self._log_lock:
+            if self._log_conn and not self._log_conn.closed:
+                self._log_conn.close()
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
 
     def _request(self, method: str, url: str, **kwargs) -> requests.Response:
         timeout = kwargs.pop("timeout", self.api.timeout_seconds)
@@ -53,7 +366,6 @@ class DatabaseAPI:
             resp = self._session.request(
                 method,
                 url,
-                headers=self._api_headers(),
                 timeout=timeout,
                 **kwargs,
             )
@@ -84,6 +396,48 @@ class DatabaseAPI:
         except requests.RequestException as e:
             raise NetworkError(f"{method} {url} -> {e}") from e
 
+    def _post_json(self, url: str, payload: dict, **kwargs) -> requests.Response:
+        # Encode once with the fast encoder and send the bytes as-is (requests' json= would
+        # re-encode with the stdlib and choke on numpy scalars).
+        return self._request(
+            "POST",
+            url,
+            data=_json.dumps_bytes(payload),
+            headers={"Content-Type": "application/json"},
+            **kwargs,
+        )
+
+    @staticmethod
+    def _decode_json(resp: requests.Response):
+        # Decode the raw bytes directly (orjson when available, no intermediate str), which
+        # matters for multi-thousand-row market-data payloads.
+        return _json.loads(resp.content)
+
+    def _get_data(self, cache_key: tuple, url: str, params: dict) -> list[dict]:
+        """
+        GET a `{"data": [...]}` endpoint and cache the rows. An expired entry that carries
+        ETag/Last-Modified is revalidated with a conditional request; on 304 the cached rows
+        are reused without transferring or decoding the body.
+        """
+        headers = {}
+        stale = self._read_cache.get_stale(cache_key)
+        if stale is not None:
+            validators = stale[1]
+            if validators.get("ETag"):
+                headers["If-None-Match"] = validators["ETag"]
+            if validators.get("Last-Modified"):
+                headers["If-Modified-Since"] = validators["Last-Modified"]
+
+        resp = self._request("GET", url, params=params, headers=headers or None)
+        if resp.status_code == 304 and stale is not None:
+            data, validators = stale
+        else:
+            payload = self._decode_json(resp)
+            data = payload.get("data", []) if isinstance(payload, dict) else []
+            validators = {h: resp.headers[h] for h in ("ETag", "Last-Modified") if h in resp.headers}
+        self._read_cache.put(cache_key, data, validators)
+        return data
+
     def get_futures_daily(
         self,
         symbols: list,
@@ -101,9 +455,13 @@ class DatabaseAPI:
         }
         if limit is not None:
             params["limit"] = int(limit)
-        resp = self._request("GET", url, params=params)
-        payload = resp.json()
-        return payload.get("data", []) if isinstance(payload, dict) else []
+
+        cache_key = self._cache_key("futures_daily", params["symbols"], start_date, end_date, limit)
+        data = self._read_cache.get(cache_key)
+        if data is not None:
+            return data
+
+        return self._get_data(cache_key, url, params)
 
     def get_symbol_daily(
         self,
@@ -122,9 +480,13 @@ class DatabaseAPI:
             params["end_date"] = end_date
         if limit is not None:
             params["limit"] = int(limit)
-        resp = self._request("GET", url, params=params)
-        payload = resp.json()
-        return payload.get("data", []) if isinstance(payload, dict) else []
+
+        cache_key = self._cache_key("symbol_daily", symbol, start_date, end_date, limit)
+        data = self._read_cache.get(cache_key)
+        if data is not None:
+            return data
+
+        return self._get_data(cache_key, url, params)
 
     def get_continuous(
         self,
@@ -145,34 +507,67 @@ class DatabaseAPI:
         if limit is not None:
             params["limit"] = int(limit)
 
-        cache_key = (base_symbol, params.get("start_date"), params.get("end_date"), params.get("limit"))
-        if cache_key in self._continuous_cache:
-            data = self._continuous_cache.pop(cache_key)
-            self._continuous_cache[cache_key] = data
+        cache_key = self._cache_key("continuous", base_symbol, start_date, end_date, limit)
+        data = self._read_cache.get(cache_key)
+        if data is not None:
             return data
 
         try:
-            resp = self._request("GET", url, params=params)
-            payload = resp.json()
-            data = payload.get("data", []) if isinstance(payload, dict) else []
+            return self._get_data(cache_key, url, params)
         except NetworkError as e:
             # For large ranges, the backend may time out; fall back to chunked fetch when possible.
-            if start_date and end_date and self._is_timeout(e):
-                data = self._get_continuous_chunked(
-                    base_symbol,
-                    start_date=start_date,
-                    end_date=end_date,
-                    limit=limit,
-                )
-            else:
+            if not (start_date and end_date and self._is_timeout(e)):
                 raise
+            data = self._get_continuous_chunked(
+                base_symbol,
+                start_date=start_date,
+                end_date=end_date,
+                limit=limit,
+            )
 
-        # Update cache (LRU).
-        self._continuous_cache[cache_key] = data
-        if len(self._continuous_cache) > self._continuous_cache_max:
-            self._continuous_cache.popitem(last=False)
+        self._read_cache.put(cache_key, data)
         return data
 
+    def get_continuous_many(
+        self,
+        base_symbols: list[str],
+        start_date: str = None,
+        end_date: str = None,
+        *,
+        limit: int | None = None,
+        max_workers: int = 8,
+    ) -> dict[str, list[dict]]:
+        """并发读取多个品种的连续合约数据，返回 {品种: rows}（键为调用方传入的原始品种名）"""
+        unique = list(dict.fromkeys(base_symbols))
+        if not unique:
+            return {}
+
+        def fetch(sym: str) -> list[dict]:
+            return self.get_continuous(sym, start_date=start_date, end_date=end_date, limit=limit)
+
+        # Requests overlap on the pooled session instead of paying one round-trip per symbol.
+        n_workers = max(1, min(int(max_workers), len(unique)))
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            return dict(zip(unique, executor.map(fetch, unique)))
+
+    def _cache_key(
+        self,
+        kind: str,
+        symbol: str,
+        start_date: str | None,
+        end_date: str | None,
+        limit: int | None,
+    ) -> tuple:
+        # Normalized so equivalent requests ("cu" vs "CU ", None vs "") share one entry.
+        return (
+            kind,
+            self.api.read_url,
+            (symbol or "").strip().upper(),
+            start_date or "",
+            end_date or "",
+            int(limit) if limit is not None else None,
+        )
+
     def _is_timeout(self, err: Exception) -> bool:
         cause = getattr(err, "__cause__", None)
         if cause is not None:
@@ -192,6 +587,7 @@ class DatabaseAPI:
         end_date: str,
         limit: int | None,
         chunk_days: int = 365,
+        max_workers: int = 8,
     ) -> list[dict]:
         """
         Fetch continuous data by smaller date ranges to avoid server-side timeouts on large queries.
@@ -205,137 +601,223 @@ class DatabaseAPI:
 
         url = f"{self.api.read_url}/api/continuous/{base_symbol}"
 
-        all_rows: list[dict] = []
-        cur = start
-        step = timedelta(days=max(1, int(chunk_days)))
-        while cur <= end:
-            cur_end = min(cur + step - timedelta(days=1), end)
-            params = {
-                "start_date": cur.isoformat(),
-                "end_date": cur_end.isoformat(),
-            }
+        # Chunk boundaries as ISO strings, computed with ordinal arithmetic.
+        step = max(1, int(chunk_days))
+        end_ord = end.toordinal()
+        chunks: list[tuple[str, str]] = [
+            (date.fromordinal(cur_ord).isoformat(), date.fromordinal(min(cur_ord + step - 1, end_ord)).isoformat())
+            for cur_ord in range(start.toordinal(), end_ord + 1, step)
+        ]
+
+        def fetch(chunk: tuple[str, str]) -> list[dict]:
+            chunk_start, chunk_end = chunk
+            # Sub-ranges are cached like direct fetches, so retries (or a recursive shrink that
+            # reproduces the same range) don't hit the network again.
+            cache_key = self._cache_key("continuous", base_symbol, chunk_start, chunk_end, limit)
+            rows = self._read_cache.get(cache_key)
+            if rows is not None:
+                return rows
+
+            params = {"start_date": chunk_start, "end_date": chunk_end}
             if limit is not None:
                 params["limit"] = int(limit)
 
             try:
-                resp = self._request("GET", url, params=params)
-                payload = resp.json()
-                rows = payload.get("data", []) if isinstance(payload, dict) else []
+                return self._get_data(cache_key, url, params)
             except NetworkError as e:
                 # If a chunk is still too large for the backend, recursively shrink it.
-                if self._is_timeout(e) and int(chunk_days) > 45:
-                    rows = self._get_continuous_chunked(
-                        base_symbol,
-                        start_date=cur.isoformat(),
-                        end_date=cur_end.isoformat(),
-                        limit=limit,
-                        chunk_days=max(30, int(chunk_days) // 2),
-                    )
-                else:
+                if not (self._is_timeout(e) and step > 45):
                     raise
-            if rows:
-                all_rows.extend(rows)
-            cur = cur_end + timedelta(days=1)
-
-        if not all_rows:
-            return []
-
-        # De-duplicate by trade_date (keep last) and sort.
-        by_date: dict[str, dict] = {}
-        for row in all_rows:
-            td = row.get("trade_date")
-            if td:
-                by_date[str(td)] = row
-        out = [by_date[k] for k in sorted(by_date.keys())]
+                rows = self._get_continuous_chunked(
+                    base_symbol,
+                    start_date=chunk_start,
+                    end_date=chunk_end,
+                    limit=limit,
+                    chunk_days=max(30, step // 2),
+                    max_workers=max_workers,
+                )
+            self._read_cache.put(cache_key, rows)
+            return rows
+
+        # Issue chunk requests concurrently over the pooled session; map() keeps chunk order.
+        # Chunks cover disjoint, increasing date ranges, so de-duplication (keep last) and
+        # ordering is a single merge pass; sorting each chunk is linear when it's already sorted.
+        out: list[dict] = []
+        last_td: str | None = None
+        n_workers = max(1, min(int(max_workers), len(chunks)))
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            for rows in executor.map(fetch, chunks):
+                if not rows:
+                    continue
+                dated = [r for r in rows if r.get("trade_date")]
+                dated.sort(key=lambda r: str(r["trade_date"]))
+                for row in dated:
+                    td = str(row["trade_date"])
+                    if last_td is None or td > last_td:
+                        out.append(row)
+                        last_td = td
+                    elif td == last_td:
+                        out[-1] = row
         return out
 
     def write_log(self, data: dict) -> bool:
         """通过API写入日志"""
-        url = f"{self.api.write_url}/api/backtest/log"
         # Logging should never block the workflow for long; use a short timeout.
-        resp = self._request("POST", url, json=data, timeout=min(5, int(self.api.timeout_seconds)))
-        result = resp.json()
+        resp = self._post_json(self._log_url, data, timeout=min(5, int(self.api.timeout_seconds)))
+        result = self._decode_json(resp)
         if not isinstance(result, dict):
             raise ModuleError("Log API returned non-JSON object")
-        if not result.get("success", False):
+        success = bool(result.get("success", False))
+        if not success:
             # Do not raise: logging failure should not kill the workflow.
-            print(f"日志API返回失败: {result.get('error', 'unknown')}")
-        return bool(result.get("success", False))
+            logger.warning(f"日志API返回失败: {result.get('error', 'unknown')}")
+        return success
+
+    def write_logs_bulk(self, entries: list[dict]) -> int:
+        """
+        批量写入日志，返回成功写入的条数。
+
+        默认逐条调用日志API（API 未提供批量端点，复用连接池中的 keep-alive 连接）；
+        开启 direct_log_writes 时在日志专用连接上一次性 INSERT 到 task_logs（失败回滚不影响其他线程的写入）。
+        """
+        if not entries:
+            return 0
+        if self.direct_log_writes:
+            with self._log_lock:
+                if self._log_conn is None or self._log_conn.closed:
+                    self._log_conn = self._open_conn()
+                with self._transaction_on(self._log_conn) as cur:
+                    return len(self.write_many("task_logs", entries, cursor=cur))
+        written = 0
+        for entry in entries:
+            if self.write_log(entry):
+                written += 1
+        return written
 
     def create_task(self, data: dict) -> bool:
         """通过API创建任务"""
-        url = f"{self.api.write_url}/api/backtest/task"
-        resp = self._request("POST", url, json=data)
-        result = resp.json()
+        resp = self._post_json(self._task_url, data)
+        result = self._decode_json(resp)
         if not isinstance(result, dict):
             raise ModuleError("Task API returned non-JSON object")
-        if not result.get("success", False):
-            print(f"任务创建API返回失败: {result.get('error', 'unknown')}")
-        return bool(result.get("success", False))
+        success = bool(result.get("success", False))
+        if not success:
+            logger.warning(f"任务创建API返回失败: {result.get('error', 'unknown')}")
+        return success
 
     def write_result(self, data: dict) -> int:
         """通过API写入回测结果"""
-        url = f"{self.api.write_url}/api/backtest/result"
-        resp = self._request("POST", url, json=data)
-        result = resp.json()
+        resp = self._post_json(self._result_url, data)
+        result = self._decode_json(resp)
         if not isinstance(result, dict):
             raise ModuleError("Result API returned non-JSON object")
         if not result.get("success", False):
-            print(f"结果API返回失败: {result.get('error', 'unknown')}")
+            logger.warning(f"结果API返回失败: {result.get('error', 'unknown')}")
             return 0
         return int(result.get("id", 0) or 0)
 
-    def read(self, query: str, params: tuple = None) -> list[dict]:
-        """直连读取数据（用于任务历史等）"""
-        conn = self.connect()
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+    def read(self, query: str, params: tuple = None, *, stream: bool = False, itersize: int = 2000):
+        """
+        直连读取数据（用于任务历史等）
+
+        stream=True 时使用服务端游标，返回逐行产出的生成器（每次只拉取 itersize 行），
+        适合大结果集；否则一次性返回 list[dict]。
+        """
+        from psycopg2.extras import RealDictCursor
+
+        if stream:
+            self._require_db_url()
+            return self._read_stream(query, params, itersize=itersize)
+        with self._read_conn() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute(query, params)
             return cur.fetchall()
 
-    def write(self, table: str, data: dict) -> int:
-        """写入数据，返回插入的ID"""
-        conn = self.connect()
+    def _read_stream(self, query: str, params: tuple | None, *, itersize: int) -> Iterator[dict]:
+        from psycopg2.extras import RealDictCursor
+
+        # A pooled connection stays checked out until the generator is exhausted or closed.
+        with self._read_conn() as conn:
+            with conn.cursor(name=f"srv_{uuid.uuid4().hex}", cursor_factory=RealDictCursor) as cur:
+                cur.itersize = max(1, int(itersize))
+                cur.execute(query, params)
+                yield from cur
+
+    def write(self, table: str, data: dict, *, cursor=None) -> int:
+        """写入数据，返回插入的ID（传入 cursor 时复用调用方事务，不单独提交）"""
         if not data:
             raise ModuleError("write() data must not be empty")
 
-        query = sql.SQL("INSERT INTO {table} ({cols}) VALUES ({vals}) RETURNING id").format(
-            table=sql.Identifier(table),
-            cols=sql.SQL(", ").join(sql.Identifier(c) for c in data.keys()),
-            vals=sql.SQL(", ").join(sql.Placeholder() for _ in data.keys()),
-        )
-
-        with conn.cursor() as cur:
+        query = _build_insert(table, tuple(data.keys()))
+        with self._write_cursor(cursor) as cur:
             cur.execute(query, list(data.values()))
-            result_id = cur.fetchone()[0]
-            conn.commit()
-            return result_id
+            return cur.fetchone()[0]
+
+    def write_many(self, table: str, rows: list[dict], *, page_size: int = 500, cursor=None) -> list[int]:
+        """批量写入（所有行须使用相同的列），返回插入的ID列表"""
+        if not rows:
+            return []
+        cols = tuple(rows[0].keys())
+        if not cols:
+            raise ModuleError("write_many() rows must not be empty")
+        col_set = set(cols)
+        if any(set(r.keys()) != col_set for r in rows):
+            raise ModuleError("write_many() rows must all have the same columns")
+
+        query = _build_insert_values(table, cols)
+        values = [tuple(r[c] for c in cols) for r in rows]
 
-    def update_where(self, table: str, data: dict, where: dict) -> int:
+        from psycopg2.extras import execute_values
+
+        with self._write_cursor(cursor) as cur:
+            # One round-trip per page instead of one per row.
+            returned = execute_values(cur, query, values, page_size=page_size, fetch=True)
+            return [r[0] for r in returned]
+
+    def update_where(self, table: str, data: dict, where: dict, *, cursor=None) -> int:
         """安全更新：where 使用列->值映射"""
-        conn = self.connect()
         if not data:
             raise ModuleError("update_where() data must not be empty")
         if not where:
             raise ModuleError("update_where() where must not be empty")
 
-        set_clause = sql.SQL(", ").join(
-            sql.SQL("{} = {}").format(sql.Identifier(k), sql.Placeholder()) for k in data.keys()
-        )
-        where_clause = sql.SQL(" AND ").join(
-            sql.SQL("{} = {}").format(sql.Identifier(k), sql.Placeholder()) for k in where.keys()
-        )
-        query = sql.SQL("UPDATE {table} SET {set_clause} WHERE {where_clause}").format(
-            table=sql.Identifier(table),
-            set_clause=set_clause,
-            where_clause=where_clause,
-        )
-
+        query = _build_update(table, tuple(data.keys()), tuple(where.keys()))
         values = list(data.values()) + list(where.values())
-        with conn.cursor() as cur:
+        with self._write_cursor(cursor) as cur:
             cur.execute(query, values)
-            conn.commit()
             return cur.rowcount
 
+    def update_many(
+        self,
+        table: str,
+        updates: list[tuple[dict, dict]],
+        *,
+        page_size: int = 500,
+        cursor=None,
+    ) -> None:
+        """批量安全更新：updates 为 (data, where) 列表，所有条目须使用相同的列"""
+        if not updates:
+            return
+        set_cols = tuple(updates[0][0].keys())
+        where_cols = tuple(updates[0][1].keys())
+        if not set_cols:
+            raise ModuleError("update_many() data must not be empty")
+        if not where_cols:
+            raise ModuleError("update_many() where must not be empty")
+        set_keys, where_keys = set(set_cols), set(where_cols)
+        if any(set(d.keys()) != set_keys or set(w.keys()) != where_keys for d, w in updates):
+            raise ModuleError("update_many() entries must all have the same columns")
+
+        query = _build_update(table, set_cols, where_cols)
+        values = [
+            [d[c] for c in set_cols] + [w[c] for c in where_cols]
+            for d, w in updates
+        ]
+
+        from psycopg2.extras import execute_batch
+
+        with self._write_cursor(cursor) as cur:
+            execute_batch(cur, query, values, page_size=page_size)
+
     def set_task_status(
         self,
         task_id: str,
@@ -1,7 +1,8 @@
+import sys
 from dataclasses import dataclass, field
 from typing import Optional
 
-@dataclass
+@dataclass(slots=True)
 class SkillResult:
     """Skill执行结果"""
     success: bool
@@ -11,7 +12,7 @@ class SkillResult:
     skipped: bool = False
     halted: bool = False
 
-@dataclass
+@dataclass(slots=True)
 class TaskConfig:
     """任务配置"""
     task_id: str
@@ -23,3 +24,7 @@ class TaskConfig:
     top_n: int = 10
     params: Optional[dict] = None
     strategy_max_evals: int = 2000
+
+    def __post_init__(self):
+        # 'smart' / 'specified': share one string object across configs.
+        self.mode = sys.intern(self.mode)
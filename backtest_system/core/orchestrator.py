@@ -1,19 +1,60 @@
 from typing import Dict, Optional
 from datetime import datetime
+import logging
 import uuid
-import json
-from concurrent.futures import ProcessPoolExecutor, as_completed
+import atexit
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from backtest_system.core import _json
 from backtest_system.core.supervisor import Supervisor
 from backtest_system.core.models import SkillResult, TaskConfig
 from backtest_system.skills.base import BaseSkill
 from backtest_system.skills.backtest_strategy import parse_position
 
+logger = logging.getLogger(__name__)
+
+# _run_attempts(first=...) default: no attempt has run yet.
+_NOT_RUN = object()
+
+# TaskConfig fields stored per mode: the full snapshot goes into the task record's `config`
+# column, the *_RESULT_KEYS subset into results["config"] (shown on the report Summary sheet).
+_SMART_CONFIG_KEYS = ("positions", "periods", "combo_range", "portfolio_models", "top_n", "strategy_max_evals", "params")
+_SMART_RESULT_KEYS = ("positions", "periods", "combo_range", "portfolio_models", "top_n", "strategy_max_evals")
+_SPECIFIED_CONFIG_KEYS = ("positions", "periods", "portfolio_models", "top_n", "strategy_max_evals", "params")
+_SPECIFIED_RESULT_KEYS = ("positions", "periods", "portfolio_models", "strategy_max_evals")
+
+
+def _config_snapshot(config: TaskConfig, keys: tuple[str, ...]) -> dict:
+    """按字段名从 TaskConfig 取值（共享引用，不做深拷贝）"""
+    return {k: getattr(config, k) for k in keys}
+
 class Orchestrator:
     """协调者：解析指令、管理依赖、调度执行"""
 
     def __init__(self, supervisor: Supervisor):
         self.supervisor = supervisor
         self.skills: Dict[str, BaseSkill] = {}
+        # Strategy worker pool, kept alive across tasks run by this orchestrator so worker
+        # start-up (process spawn + package import) is paid once.
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._executor_key: Optional[tuple] = None
+
+    def _get_executor(self, max_workers: int, *, initializer, initargs: tuple) -> ProcessPoolExecutor:
+        key = (max_workers, initializer, initargs)
+        if self._executor is not None and self._executor_key == key:
+            return self._executor
+        self.shutdown()
+        self._executor = ProcessPoolExecutor(max_workers=max_workers, initializer=initializer, initargs=initargs)
+        self._executor_key = key
+        atexit.register(self.shutdown)
+        return self._executor
+
+    def shutdown(self) -> None:
+        """关闭常驻的策略 worker 进程池"""
+        executor, self._executor, self._executor_key = self._executor, None, None
+        if executor is not None:
+            atexit.unregister(self.shutdown)
+            executor.shutdown(wait=True, cancel_futures=True)
 
     def register_skill(self, skill: BaseSkill):
         """注册skill"""
@@ -21,14 +62,26 @@ class Orchestrator:
 
     def _execute_skill(self, skill_name: str, params: dict, max_retries: int = 3) -> SkillResult:
         """执行单个skill，向Supervisor上报状态"""
-        if skill_name not in self.skills:
+        skill = self.skills.get(skill_name)
+        if skill is None:
             return SkillResult(success=False, error=f"Skill {skill_name} not found")
 
         self.supervisor.on_skill_start(skill_name, params)
+        return self._run_attempts(skill.execute, skill_name, params, max_retries)
 
+    def _run_attempts(self, execute, skill_name: str, params: dict, max_retries: int, first=_NOT_RUN) -> SkillResult:
+        """
+        重试循环（START 由调用方记录）。first 为已在 worker 进程中完成的第一次尝试的结果
+        （SkillResult 或其抛出的异常），只有它要求重试时才在本进程再次执行。
+        """
         for attempt in range(max_retries):
             try:
-                result = self.skills[skill_name].execute(**params)
+                if attempt == 0 and first is not _NOT_RUN:
+                    if isinstance(first, Exception):
+                        raise first
+                    result = first
+                else:
+                    result = execute(**params)
                 if result is None:
                     result = SkillResult(success=False, error="Skill returned None")
 
@@ -40,7 +93,7 @@ class Orchestrator:
                 if result.halted or result.skipped:
                     return result
                 if result.retry:
-                    print(f"重试 {attempt + 1}/{max_retries}...")
+                    logger.info(f"重试 {attempt + 1}/{max_retries}...")
                     continue
 
                 # Plain failure (no retry/skip/halt flags).
@@ -53,7 +106,7 @@ class Orchestrator:
                     return error_result
                 if not error_result.retry:
                     return error_result
-                print(f"重试 {attempt + 1}/{max_retries}...")
+                logger.info(f"重试 {attempt + 1}/{max_retries}...")
 
         final = SkillResult(success=False, error="Max retries exceeded")
         self.supervisor.on_skill_complete(skill_name, final)
@@ -66,55 +119,28 @@ class Orchestrator:
 
         # 先创建任务记录（带重试）
         now = datetime.now().replace(microsecond=0).isoformat(sep=" ")
-        task_created = False
-        for attempt in range(3):
-            try:
-                config_snapshot = {
-                    "positions": config.positions,
-                    "periods": config.periods,
-                    "combo_range": config.combo_range,
-                    "portfolio_models": config.portfolio_models,
-                    "top_n": config.top_n,
-                    "strategy_max_evals": config.strategy_max_evals,
-                    "params": config.params,
-                }
-                payload = {
-                    "task_id": task_id,
-                    "mode": "smart",
-                    "status": "running",
-                    "positions": json.dumps(config.positions, ensure_ascii=True),
-                    "periods": json.dumps(config.periods or [], ensure_ascii=True),
-                    "combo_range": f"{config.combo_range[0]}-{config.combo_range[1]}" if config.combo_range else None,
-                    "portfolio_models": json.dumps(config.portfolio_models or [], ensure_ascii=True),
-                    "top_n": int(config.top_n),
-                    "config": json.dumps(config_snapshot, ensure_ascii=True),
-                    "started_at": now,
-                    "created_at": now,
-                }
-                payload = {k: v for k, v in payload.items() if v is not None}
-                task_created = self.supervisor.db_api.create_task(payload)
-            except Exception as e:
-                task_created = False
-                print(f"任务创建异常: {e}")
-            if task_created:
-                break
-            print(f"任务创建重试 {attempt + 1}/3...")
-
-        if not task_created:
-            print("警告: 任务创建失败，日志将不会写入数据库")
-            self.supervisor.disable_remote_logging()  # 禁用远程日志写入（保留本地日志）
+        config_snapshot = _config_snapshot(config, _SMART_CONFIG_KEYS)
+        payload = {
+            "task_id": task_id,
+            "mode": "smart",
+            "status": "running",
+            "positions": _json.dumps(config.positions),
+            "periods": _json.dumps(config.periods or []),
+            "portfolio_models": _json.dumps(config.portfolio_models or []),
+            "top_n": int(config.top_n),
+            "config": _json.dumps(config_snapshot),
+            "started_at": now,
+            "created_at": now,
+        }
+        # combo_range is the only optional column; omit it rather than sending null.
+        if config.combo_range:
+            payload["combo_range"] = f"{config.combo_range[0]}-{config.combo_range[1]}"
+        self._create_task_record(payload)
 
         results = {
             "task_id": task_id,
             "mode": "smart",
-            "config": {
-                "positions": config.positions,
-                "periods": config.periods,
-                "combo_range": config.combo_range,
-                "portfolio_models": config.portfolio_models,
-                "top_n": config.top_n,
-                "strategy_max_evals": config.strategy_max_evals,
-            },
+            "config": {k: config_snapshot[k] for k in _SMART_RESULT_KEYS},
             "steps": [],
         }
 
@@ -136,35 +162,37 @@ class Orchestrator:
                 return results
 
         # 2. 并行执行各头寸的参数优化（2个worker，保护API）
-        from backtest_system.skills.backtest_strategy import _run_optimization_pure
+        from backtest_system.skills.backtest_strategy import _init_optimization_worker, _run_optimization_star
         
         strategy_results = {}
         n_workers = min(2, len(positions))  # 限制并发：保护API
         api_config = self.supervisor.db_api.api  # 可序列化配置
         
-        with ProcessPoolExecutor(max_workers=n_workers) as executor:
-            # 提交任务
-            futures = {
-                executor.submit(
-                    _run_optimization_pure,
-                    pos,
-                    config.periods,
-                    parse_position(pos)["direction"],  # 需要导入 parse_position
-                    api_config,
-                    config.strategy_max_evals,
-                ): pos
-                for pos in positions
-            }
-            
-            # 收集结果
-            for future in as_completed(futures):
-                position = futures[future]
-                try:
-                    result = future.result(timeout=600)  # 10分钟超时
-                    strategy_results[position] = result
-                    print(f"✓ {position} 完成")
-                except Exception as e:
-                    print(f"✗ {position} 失败: {e}")
+        executor = self._get_executor(
+            n_workers,
+            initializer=_init_optimization_worker,
+            initargs=(api_config, self.supervisor.db_api.cache_dir),
+        )
+        # 提交任务：map 按提交顺序返回结果，worker 内的异常已转成 {"error": ...}
+        args = [
+            (pos, config.periods, parse_position(pos)["direction"], config.strategy_max_evals)
+            for pos in positions
+        ]
+
+        # 收集结果
+        try:
+            for position, result in zip(positions, executor.map(_run_optimization_star, args, chunksize=1)):
+                strategy_results[position] = result
+                if "error" in result:
+                    logger.warning(f"✗ {position} 失败: {result['error']}")
+                else:
+                    logger.info(f"✓ {position} 完成")
+        except BrokenProcessPool as e:
+            # A dead worker poisons the pool; rebuild it on the next task.
+            self.shutdown()
+            for position in positions:
+                if position not in strategy_results:
+                    logger.warning(f"✗ {position} 失败: {e}")
                     strategy_results[position] = {"error": str(e)}
         
         # 将结果转换为 SkillResult 格式（兼容后续流程）
@@ -202,51 +230,25 @@ class Orchestrator:
 
         # 先创建任务记录（带重试）
         now = datetime.now().replace(microsecond=0).isoformat(sep=" ")
-        task_created = False
-        for attempt in range(3):
-            try:
-                config_snapshot = {
-                    "positions": config.positions,
-                    "periods": config.periods,
-                    "portfolio_models": config.portfolio_models,
-                    "top_n": config.top_n,
-                    "strategy_max_evals": config.strategy_max_evals,
-                    "params": config.params,
-                }
-                payload = {
-                    "task_id": task_id,
-                    "mode": "specified",
-                    "status": "running",
-                    "positions": json.dumps(config.positions, ensure_ascii=True),
-                    "periods": json.dumps(config.periods or [], ensure_ascii=True),
-                    "portfolio_models": json.dumps(config.portfolio_models or [], ensure_ascii=True),
-                    "top_n": int(config.top_n),
-                    "config": json.dumps(config_snapshot, ensure_ascii=True),
-                    "started_at": now,
-                    "created_at": now,
-                }
-                payload = {k: v for k, v in payload.items() if v is not None}
-                task_created = self.supervisor.db_api.create_task(payload)
-            except Exception as e:
-                task_created = False
-                print(f"任务创建异常: {e}")
-            if task_created:
-                break
-            print(f"任务创建重试 {attempt + 1}/3...")
-
-        if not task_created:
-            print("警告: 任务创建失败，日志将不会写入数据库")
-            self.supervisor.disable_remote_logging()  # 禁用远程日志写入（保留本地日志）
+        config_snapshot = _config_snapshot(config, _SPECIFIED_CONFIG_KEYS)
+        payload = {
+            "task_id": task_id,
+            "mode": "specified",
+            "status": "running",
+            "positions": _json.dumps(config.positions),
+            "periods": _json.dumps(config.periods or []),
+            "portfolio_models": _json.dumps(config.portfolio_models or []),
+            "top_n": int(config.top_n),
+            "config": _json.dumps(config_snapshot),
+            "started_at": now,
+            "created_at": now,
+        }
+        self._create_task_record(payload)
 
         results = {
             "task_id": task_id,
             "mode": "specified",
-            "config": {
-                "positions": config.positions,
-                "periods": config.periods,
-                "portfolio_models": config.portfolio_models,
-                "strategy_max_evals": config.strategy_max_evals,
-            },
+            "config": {k: config_snapshot[k] for k in _SPECIFIED_RESULT_KEYS},
             "steps": [],
         }
 
@@ -266,16 +268,9 @@ class Orchestrator:
                 self._finalize_task(results)
                 return results
 
-        # 2. 单策略回测
-        strategy_results = {}
-        for position in positions:
-            bt_result = self._execute_skill("backtest_strategy", {
-                "position": position,
-                "periods": config.periods,
-                "params": config.params,
-                "max_evals": config.strategy_max_evals,
-            })
-            strategy_results[position] = bt_result
+        # 2. 单策略回测（多个头寸时并行，与智能模式共用 worker 进程池）
+        strategy_results = self._run_strategies(positions, config)
+        for position, bt_result in strategy_results.items():
             results["steps"].append({"skill": "backtest_strategy", "position": position, "result": bt_result})
 
         # 3. 组合回测
@@ -294,37 +289,105 @@ class Orchestrator:
         self._finalize_task(results)
         return results
 
-    def _finalize_task(self, results: dict) -> None:
+    def _run_strategies(self, positions: list[str], config: TaskConfig) -> dict[str, SkillResult]:
+        """指定模式的单策略回测：逐头寸的 skill 调用分发到 worker 进程，结果按头寸顺序返回"""
+        param_list = [
+            {
+                "position": position,
+                "periods": config.periods,
+                "params": config.params,
+                "max_evals": config.strategy_max_evals,
+            }
+            for position in positions
+        ]
+        n_workers = min(2, len(positions))  # 限制并发：保护API（与智能模式一致）
+        skill = self.skills.get("backtest_strategy")
+        if n_workers <= 1 or skill is None:
+            return {p["position"]: self._execute_skill("backtest_strategy", p) for p in param_list}
+
+        from backtest_system.skills.backtest_strategy import _init_optimization_worker, _run_specified_star
+
+        executor = self._get_executor(
+            n_workers,
+            initializer=_init_optimization_worker,
+            initargs=(self.supervisor.db_api.api, self.supervisor.db_api.cache_dir),
+        )
+        args = [(p["position"], p["periods"], p["params"], p["max_evals"]) for p in param_list]
+
+        strategy_results: dict[str, SkillResult] = {}
+        try:
+            for p, outcome in zip(param_list, executor.map(_run_specified_star, args, chunksize=1)):
+                # The worker's run is the first attempt: its result or exception goes through the usual
+                # complete/error handling, and only a retry request re-runs the position in-process.
+                self.supervisor.on_skill_start("backtest_strategy", p)
+                strategy_results[p["position"]] = self._run_attempts(
+                    skill.execute, "backtest_strategy", p, 3, first=outcome
+                )
+        except BrokenProcessPool:
+            # A dead worker poisons the pool; rebuild it on the next task and finish the positions
+            # not consumed yet (their START is not logged yet) sequentially.
+            self.shutdown()
+            for p in param_list:
+                if p["position"] not in strategy_results:
+                    strategy_results[p["position"]] = self._execute_skill("backtest_strategy", p)
+        return strategy_results
+
+    def _create_task_record(self, payload: dict) -> bool:
+        """创建任务记录（带重试）；payload 只构建一次，重试只重发请求"""
+        task_created = False
+        for attempt in range(3):
+            try:
+                task_created = self.supervisor.db_api.create_task(payload)
+            except Exception as e:
+                task_created = False
+                logger.warning(f"任务创建异常: {e}")
+            if task_created:
+                break
+            logger.info(f"任务创建重试 {attempt + 1}/3...")
+
+        if not task_created:
+            logger.warning("警告: 任务创建失败，日志将不会写入数据库")
+            self.supervisor.disable_remote_logging()  # 禁用远程日志写入（保留本地日志）
+        return task_created
+
+    def _finalize_task(self, results: dict) -> dict:
         """
         Best-effort task status update (direct DB). No-op if BACKTEST_DB_URL is not configured.
+        Returns the {"status", "error"} summary.
         """
+        # Remote logs are written in the background; make sure this task's entries land first.
+        self.supervisor.flush(timeout=10.0)
+
+        summary = self.summarize_steps(results.get("steps", []) or [])
+
         task_id = results.get("task_id")
         if not task_id:
-            return
-
-        steps = results.get("steps", []) or []
-        # Prefer explicit halted, then generic failures.
-        status = "completed"
-        error_message = None
-        for step in steps:
-            r = step.get("result")
-            if not r:
-                continue
-            if getattr(r, "halted", False):
-                status = "halted"
-                error_message = getattr(r, "error", None)
-                break
-            if not getattr(r, "success", True):
-                status = "failed"
-                error_message = getattr(r, "error", None)
+            return summary
 
         try:
             self.supervisor.db_api.set_task_status(
                 task_id,
-                status,
-                error_message=error_message,
+                summary["status"],
+                error_message=summary["error"],
                 completed_at=datetime.now(),
             )
         except Exception:
             # Status update is best-effort; ignore.
             pass
+        return summary
+
+    @staticmethod
+    def summarize_steps(steps: list) -> dict:
+        """汇总任务状态：halted 优先，其次 failed（取最后一个失败步骤的错误）"""
+        status = "completed"
+        error = None
+        for step in steps:
+            r = step.get("result")
+            if not r:
+                continue
+            if r.halted:
+                return {"status": "halted", "error": r.error}
+            if not r.success:
+                status = "failed"
+                error = r.error
+        return {"status": status, "error": error}
@@ -1,10 +1,36 @@
 from datetime import datetime
-from typing import Optional
+from typing import IO, Callable, Optional
+import atexit
+import collections
+import logging
 import os
+import queue
+import threading
+import time
+import weakref
+from backtest_system.core import _json
 from backtest_system.core.database import DatabaseAPI
 from backtest_system.core.models import SkillResult
 from backtest_system.core.exceptions import DataValidationError, ModuleError, NetworkError
 
+logger = logging.getLogger(__name__)
+
+# Value types that never need the hasattr(__dict__) -> str() sanitization pass before dumping.
+_PLAIN_LOG_TYPES = frozenset({str, int, float, bool, type(None), list, tuple, dict})
+
+# Supervisors not yet close()d. One exit hook drains and closes them all; the set is weak so it
+# doesn't keep discarded instances (and their file handles) alive.
+_LIVE_SUPERVISORS: "weakref.WeakSet[Supervisor]" = weakref.WeakSet()
+
+
+def _close_live_supervisors() -> None:
+    for supervisor in list(_LIVE_SUPERVISORS):
+        supervisor.close()
+
+
+atexit.register(_close_live_supervisors)
+
+
 class Supervisor:
     """监管者：监控状态、处理异常、升级人工"""
 
@@ -16,20 +42,49 @@ class Supervisor:
         on_escalate: str = "halt",  # halt | retry | skip
         max_log_data_chars: int = 20000,
         log_dir: str | None = None,
+        log_batch_size: int = 50,
+        log_flush_interval: float = 0.2,
+        execution_log_size: int = 2000,
+        on_escalate_callback: Optional[Callable[[str, Exception], str]] = None,
     ):
         self.db_api = db_api
         self.current_task_id: Optional[str] = None
-        self.execution_log: list = []
+        # Recent entries only; the full history lives in the local jsonl file / task_logs table.
+        self.execution_log: collections.deque = collections.deque(maxlen=execution_log_size)
         self.non_interactive = non_interactive
         self.on_escalate = on_escalate
+        # Interactive escalation is supplied by the caller (e.g. a tty prompt in the CLI);
+        # it returns "retry" | "skip" | "halt". Library code never reads stdin itself.
+        self.on_escalate_callback = on_escalate_callback
         self.max_log_data_chars = max_log_data_chars
         self.log_dir = log_dir
         self.remote_logging_enabled = True
+        # (epoch seconds, ISO string) of the last log timestamp; reused for events in the same burst.
+        self._last_ts: tuple[float, str] = (0.0, "")
+        # Remote log writes are batched by a background flusher so skills never wait on the API/DB.
+        self.log_batch_size = max(1, int(log_batch_size))
+        self.log_flush_interval = log_flush_interval
+        self._log_queue: queue.Queue = queue.Queue()
+        self._log_pending = 0
+        self._log_pending_cv = threading.Condition()
+        self._log_flusher: threading.Thread | None = None
+        # Local jsonl log handles, opened once per task instead of once per entry.
+        self._log_files: dict[str, IO[bytes]] = {}
+        _LIVE_SUPERVISORS.add(self)
 
     def set_task_id(self, task_id: str):
+        # Drain the previous task's entries before re-enabling remote logging for the new one.
+        self.flush()
+        self._close_all_log_files()
         self.current_task_id = task_id
         self.remote_logging_enabled = True
 
+    def close(self, timeout: float = 10.0) -> None:
+        """写完排队中的远程日志并关闭本地日志文件（进程退出时对未关闭的实例自动调用）"""
+        _LIVE_SUPERVISORS.discard(self)
+        self.flush(timeout=timeout)
+        self._close_all_log_files()
+
     def disable_remote_logging(self):
         # Used when task creation fails on the server. Keep local logs, skip DB writes.
         self.remote_logging_enabled = False
@@ -37,18 +92,18 @@ class Supervisor:
     def on_skill_start(self, skill_name: str, params: dict):
         """记录skill开始执行"""
         self._log("START", skill_name, params)
-        print(f"[{skill_name}] 开始执行...")
+        logger.info(f"[{skill_name}] 开始执行...")
 
     def on_skill_complete(self, skill_name: str, result: SkillResult):
         """记录skill完成"""
         if result.success:
             self._log("COMPLETE", skill_name, result.data)
-            print(f"[{skill_name}] 执行完成")
+            logger.info(f"[{skill_name}] 执行完成")
         else:
             # Treat non-exception failures as ERROR events so dashboards/DB can see them.
             payload = {"error": result.error, "data": result.data}
             self._log("ERROR", skill_name, payload)
-            print(f"[{skill_name}] 执行失败: {result.error}")
+            logger.warning(f"[{skill_name}] 执行失败: {result.error}")
 
     def on_skill_error(self, skill_name: str, error: Exception) -> SkillResult:
         """处理skill执行错误"""
@@ -57,10 +112,10 @@ class Supervisor:
 
         if action == "retry":
             # Print the underlying error so operators can see which URL/status failed.
-            print(f"[{skill_name}] 网络错误: {error}，准备重试...")
+            logger.warning(f"[{skill_name}] 网络错误: {error}，准备重试...")
             return SkillResult(success=False, retry=True)
         elif action == "skip":
-            print(f"[{skill_name}] 跳过此步骤")
+            logger.info(f"[{skill_name}] 跳过此步骤")
             return SkillResult(success=False, skipped=True)
         elif action == "escalate":
             return self._escalate_to_human(skill_name, error)
@@ -77,85 +132,161 @@ class Supervisor:
 
     def _escalate_to_human(self, skill_name: str, error: Exception) -> SkillResult:
         """升级到人工处理"""
-        if self.non_interactive:
-            if self.on_escalate == "retry":
-                return SkillResult(success=False, retry=True)
-            if self.on_escalate == "skip":
-                return SkillResult(success=False, skipped=True)
-            return SkillResult(success=False, halted=True, error=str(error))
-
-        print("\n需要人工干预")
-        print(f"Skill: {skill_name}")
-        print(f"错误: {error}")
+        action = self.on_escalate
+        if not self.non_interactive and self.on_escalate_callback is not None:
+            action = self.on_escalate_callback(skill_name, error)
 
-        while True:
-            choice = input("请选择: [r]重试 / [s]跳过 / [a]中止: ").strip().lower()
-            if choice == 'r':
-                return SkillResult(success=False, retry=True)
-            elif choice == 's':
-                return SkillResult(success=False, skipped=True)
-            elif choice == 'a':
-                return SkillResult(success=False, halted=True)
-            print("无效选择，请重新输入")
+        if action == "retry":
+            return SkillResult(success=False, retry=True)
+        if action == "skip":
+            return SkillResult(success=False, skipped=True)
+        return SkillResult(success=False, halted=True, error=str(error))
 
     def _log(self, event: str, skill_name: str, data):
         """记录到数据库"""
-        import json
+        remote = bool(self.db_api and self.current_task_id and self.remote_logging_enabled)
+        local = bool(self.log_dir and self.current_task_id)
+        if not remote and not local:
+            # Nothing persists this entry; keep an in-memory marker and skip serialization.
+            self.execution_log.append({
+                "task_id": self.current_task_id,
+                "skill_name": skill_name,
+                "event": event,
+                "created_at": self._timestamp(),
+            })
+            return
 
-        serializable_data = None
+        # Non-dict data (None/str/exception text) is stored only as the message; no JSON needed.
         if isinstance(data, dict):
-            try:
-                # 尝试将dict中的值转换为可序列化格式
-                clean_data = {}
-                for k, v in data.items():
-                    if hasattr(v, "__dict__"):
-                        clean_data[k] = str(v)
-                    else:
-                        clean_data[k] = v
-                serializable_data = json.dumps(clean_data, default=str)
-            except (TypeError, ValueError):
-                serializable_data = str(data)
-        elif data is not None:
-            # Non-dict data: keep a string message and avoid double-storing.
+            message = None
+            serializable_data = self._serialize_log_data(data)
+        else:
+            message = data if type(data) is str else str(data)
             serializable_data = None
 
-        if serializable_data and len(serializable_data) > self.max_log_data_chars:
-            serializable_data = serializable_data[: self.max_log_data_chars] + "...(truncated)"
-
         log_entry = {
             "task_id": self.current_task_id,
             "skill_name": skill_name,
             "event": event,
-            "message": str(data) if not isinstance(data, dict) else None,
+            "message": message,
             "data": serializable_data,
-            "created_at": datetime.now().isoformat()
+            "created_at": self._timestamp(),
         }
         self.execution_log.append(log_entry)
 
         # Always persist a local copy when configured (helps when DB/API is flaky).
-        self._append_local_log(log_entry)
+        if local:
+            self._append_local_log(log_entry)
 
-        if self.db_api and self.current_task_id and self.remote_logging_enabled:
+        if remote:
+            self._enqueue_remote_log(log_entry)
+
+    def _timestamp(self) -> str:
+        # Events fired within 50ms of each other share one ISO string instead of formatting each.
+        t = time.time()
+        if t - self._last_ts[0] > 0.05:
+            self._last_ts = (t, datetime.fromtimestamp(t).isoformat())
+        return self._last_ts[1]
+
+    def _serialize_log_data(self, data: dict) -> str:
+        # Common case: plain values (START params, metric dicts) serialize directly without a copy.
+        if all(type(v) in _PLAIN_LOG_TYPES for v in data.values()):
+            clean_data = data
+        else:
+            # 尝试将dict中的值转换为可序列化格式
+            clean_data = {k: str(v) if hasattr(v, "__dict__") else v for k, v in data.items()}
+        try:
+            serializable_data = _json.dumps(clean_data, default=str)
+        except (TypeError, ValueError):
+            serializable_data = str(data)
+        if len(serializable_data) > self.max_log_data_chars:
+            serializable_data = serializable_data[: self.max_log_data_chars] + "...(truncated)"
+        return serializable_data
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """落盘本地日志并等待已排队的远程日志写完；超时返回False（日志写入是尽力而为）"""
+        self._flush_local_logs()
+        deadline = time.monotonic() + timeout
+        with self._log_pending_cv:
+            while self._log_pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logger.warning(f"[日志] 等待远程日志写入超时，仍有 {self._log_pending} 条未写入")
+                    return False
+                self._log_pending_cv.wait(remaining)
+        return True
+
+    def _enqueue_remote_log(self, log_entry: dict) -> None:
+        with self._log_pending_cv:
+            self._log_pending += 1
+        if self._log_flusher is None or not self._log_flusher.is_alive():
+            self._log_flusher = threading.Thread(target=self._flush_loop, name="supervisor-log-flusher", daemon=True)
+            self._log_flusher.start()
+        self._log_queue.put(log_entry)
+
+    def _flush_loop(self) -> None:
+        while True:
+            batch = [self._log_queue.get()]
+            # Collect up to log_batch_size entries, or whatever arrived within the flush interval.
+            deadline = time.monotonic() + self.log_flush_interval
+            while len(batch) < self.log_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._log_queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
             try:
-                success = self.db_api.write_log(log_entry)
-                if not success:
-                    print(f"[日志] 写入失败")
-            except Exception as e:
-                # Remote logging is best-effort. Disable it for this task after the first failure
-                # to avoid repeated timeouts slowing down the workflow.
-                print(f"日志写入异常: {e}（已自动关闭远程日志写入，本地日志仍写入 {self.log_dir or 'output'}）")
-                self.remote_logging_enabled = False
+                self._write_remote_logs(batch)
+                self._flush_local_logs()
+            finally:
+                with self._log_pending_cv:
+                    self._log_pending -= len(batch)
+                    self._log_pending_cv.notify_all()
+
+    def _write_remote_logs(self, batch: list[dict]) -> None:
+        if not self.remote_logging_enabled:
+            return
+        try:
+            written = self.db_api.write_logs_bulk(batch)
+            if written < len(batch):
+                logger.warning(f"[日志] 写入失败 {len(batch) - written} 条")
+        except Exception as e:
+            # Remote logging is best-effort. Disable it for this task after the first failure
+            # to avoid repeated timeouts slowing down the workflow.
+            logger.warning(f"日志写入异常: {e}（已自动关闭远程日志写入，本地日志仍写入 {self.log_dir or 'output'}）")
+            self.remote_logging_enabled = False
 
     def _append_local_log(self, log_entry: dict) -> None:
         if not self.log_dir or not self.current_task_id:
             return
         try:
-            os.makedirs(self.log_dir, exist_ok=True)
-            path = os.path.join(self.log_dir, f"{self.current_task_id}.logs.jsonl")
-            import json
-
-            with open(path, "a", encoding="utf-8") as f:
-                f.write(json.dumps(log_entry, ensure_ascii=True, default=str) + "\n")
+            f = self._log_files.get(self.current_task_id) or self._open_log(self.current_task_id)
+            # Buffered: flushed after each remote batch, on flush() and on close.
+            f.write(_json.dumps_bytes(log_entry, default=str) + b"\n")
         except Exception:
             # Local logging is best-effort.
             pass
+
+    def _open_log(self, task_id: str) -> IO[bytes]:
+        os.makedirs(self.log_dir, exist_ok=True)
+        f = open(os.path.join(self.log_dir, f"{task_id}.logs.jsonl"), "ab", buffering=65536)
+        self._log_files[task_id] = f
+        return f
+
+    def _flush_local_logs(self) -> None:
+        # Called from the flusher thread too; snapshot the handles and ignore ones closed meanwhile.
+        for f in list(self._log_files.values()):
+            try:
+                f.flush()
+            except Exception:
+                pass
+
+    def _close_all_log_files(self) -> None:
+        files, self._log_files = self._log_files, {}
+        for f in files.values():
+            try:
+                f.close()
+            except Exception:
+                pass
@@ -1,3 +1,8 @@
+import logging
+import os
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
 import click
 from backtest_system.core.database import DatabaseAPI
 from backtest_system.core.supervisor import Supervisor
@@ -9,6 +14,9 @@ from backtest_system.skills.backtest_strategy import BacktestStrategySkill
 from backtest_system.skills.backtest_portfolio import BacktestPortfolioSkill
 from backtest_system.skills.generate_report import GenerateReportSkill
 
+# Not __name__: this module runs as __main__ via `python -m backtest_system.main`.
+logger = logging.getLogger("backtest_system.main")
+
 @click.group()
 @click.option(
     "--config",
@@ -22,6 +30,7 @@ from backtest_system.skills.generate_report import GenerateReportSkill
 def cli(ctx: click.Context, config_path: str | None):
     """自动策略回测系统"""
     ctx.obj = load_config(config_path)
+    ctx.call_on_close(_setup_logging())
 
 @cli.command()
 @click.option(
@@ -58,12 +67,18 @@ def cli(ctx: click.Context, config_path: str | None):
 @click.pass_obj
 def smart(cfg: BacktestConfig, positions, periods, combo_range, portfolio_models, top_n, strategy_max_evals):
     """智能模式"""
-    db_api = DatabaseAPI(cfg.database.url, cfg.api)
+    db_api = DatabaseAPI(
+        cfg.database.url,
+        cfg.api,
+        cache_dir=_cache_dir(cfg),
+        direct_log_writes=cfg.database.direct_log_writes,
+    )
     supervisor = Supervisor(
         db_api,
         non_interactive=cfg.app.non_interactive,
         on_escalate=cfg.app.on_escalate,
         log_dir=cfg.app.output_dir,
+        on_escalate_callback=_escalation_prompt(),
     )
     orchestrator = Orchestrator(supervisor)
 
@@ -86,20 +101,20 @@ def smart(cfg: BacktestConfig, positions, periods, combo_range, portfolio_models
     )
 
     results = orchestrator.run_smart_mode(config)
-    status = _summarize_status(results)
+    status = Orchestrator.summarize_steps(results.get("steps", []) or [])
     if status["status"] == "completed":
-        print(f"\n任务完成: {results['task_id']}")
+        logger.info(f"\n任务完成: {results['task_id']}")
     else:
-        print(f"\n任务{status['status']}: {results['task_id']}")
+        logger.info(f"\n任务{status['status']}: {results['task_id']}")
         if status.get("error"):
-            print(f"原因: {status['error']}")
+            logger.info(f"原因: {status['error']}")
 
     # 打印报告路径
     for step in results.get("steps", []):
         if step.get("skill") == "generate_report" and step.get("result"):
             report_data = step["result"].data
             if report_data:
-                print(f"Excel报告: {report_data.get('excel_path')}")
+                logger.info(f"Excel报告: {report_data.get('excel_path')}")
 
 @cli.command()
 @click.option('--positions', required=True, help='头寸池（候选策略），逗号分隔。')
@@ -109,12 +124,18 @@ def smart(cfg: BacktestConfig, positions, periods, combo_range, portfolio_models
 @click.pass_obj
 def specified(cfg: BacktestConfig, positions, period, portfolio_model, strategy_max_evals):
     """指定模式"""
-    db_api = DatabaseAPI(cfg.database.url, cfg.api)
+    db_api = DatabaseAPI(
+        cfg.database.url,
+        cfg.api,
+        cache_dir=_cache_dir(cfg),
+        direct_log_writes=cfg.database.direct_log_writes,
+    )
     supervisor = Supervisor(
         db_api,
         non_interactive=cfg.app.non_interactive,
         on_escalate=cfg.app.on_escalate,
         log_dir=cfg.app.output_dir,
+        on_escalate_callback=_escalation_prompt(),
     )
     orchestrator = Orchestrator(supervisor)
 
@@ -133,13 +154,13 @@ def specified(cfg: BacktestConfig, positions, period, portfolio_model, strategy_
     )
 
     results = orchestrator.run_specified_mode(config)
-    status = _summarize_status(results)
+    status = Orchestrator.summarize_steps(results.get("steps", []) or [])
     if status["status"] == "completed":
-        print(f"任务完成: {results['task_id']}")
+        logger.info(f"任务完成: {results['task_id']}")
     else:
-        print(f"任务{status['status']}: {results['task_id']}")
+        logger.info(f"任务{status['status']}: {results['task_id']}")
         if status.get("error"):
-            print(f"原因: {status['error']}")
+            logger.info(f"原因: {status['error']}")
 
 @cli.command()
 @click.option('--limit', default=20, help='显示条数')
@@ -155,23 +176,50 @@ def history(cfg: BacktestConfig, limit):
     except Exception as e:
         print(f"无法读取历史任务（需要配置 BACKTEST_DB_URL ）: {e}")
 
-def _summarize_status(results: dict) -> dict:
-    steps = results.get("steps", []) or []
-    status = "completed"
-    error = None
-    for step in steps:
-        r = step.get("result")
-        if not r:
-            continue
-        if getattr(r, "halted", False):
-            status = "halted"
-            error = getattr(r, "error", None)
-            break
-        if not getattr(r, "success", True):
-            status = "failed"
-            if error is None:
-                error = getattr(r, "error", None)
-    return {"status": status, "error": error}
+def _setup_logging():
+    """
+    控制台输出交给后台线程：业务代码只把日志记录放进队列，格式化和写 stdout 在 QueueListener 里完成。
+    返回清理函数（停止 listener 并输出剩余日志）。
+    """
+    log_queue: queue.Queue = queue.Queue(-1)
+    console = logging.StreamHandler(sys.stdout)
+    console.setFormatter(logging.Formatter("%(message)s"))
+    listener = QueueListener(log_queue, console)
+    handler = QueueHandler(log_queue)
+    root = logging.getLogger("backtest_system")
+    root.setLevel(logging.INFO)
+    root.addHandler(handler)
+    listener.start()
+
+    def teardown() -> None:
+        root.removeHandler(handler)
+        listener.stop()
+
+    return teardown
+
+def _escalation_prompt():
+    """仅在连接终端时提供交互式人工干预；否则返回 None，按 on_escalate 策略处理"""
+    if not sys.stdin.isatty():
+        return None
+
+    def prompt(skill_name: str, error: Exception) -> str:
+        print("\n需要人工干预")
+        print(f"Skill: {skill_name}")
+        print(f"错误: {error}")
+        while True:
+            choice = input("请选择: [r]重试 / [s]跳过 / [a]中止: ").strip().lower()
+            if choice == 'r':
+                return "retry"
+            elif choice == 's':
+                return "skip"
+            elif choice == 'a':
+                return "halt"
+            print("无效选择，请重新输入")
+
+    return prompt
+
+def _cache_dir(cfg: BacktestConfig) -> str:
+    return os.path.join(cfg.app.output_dir, ".cache")
 
 if __name__ == '__main__':
     cli()
@@ -45,5 +45,6 @@ CREATE TABLE task_logs (
 
 -- 索引
 CREATE INDEX idx_tasks_status ON backtest_tasks(status);
+CREATE INDEX idx_tasks_created ON backtest_tasks(created_at DESC, task_id DESC);
 CREATE INDEX idx_results_task ON backtest_results(task_id);
 CREATE INDEX idx_logs_task ON task_logs(task_id);
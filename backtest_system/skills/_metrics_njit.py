@@ -0,0 +1,95 @@
+# Portfolio performance kernels over daily returns. Compiled with numba when it is installed (one
+# fused pass, no temporaries); otherwise an equivalent numpy implementation is used for `metrics`
+# and `combo_metrics` is None (callers evaluate combos one by one).
+import math
+
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # optional speedup; fall back to numpy
+    njit = None
+
+TRADING_DAYS = 252
+
+
+def _metrics_loop(r: np.ndarray) -> tuple:
+    """(sharpe, total_return, max_drawdown, annualized_return, annualized_volatility, n)"""
+    n = r.size
+    # Welford running mean/variance (ddof=0), compounded equity and running peak in one pass.
+    mean = 0.0
+    m2 = 0.0
+    cum = 1.0
+    peak = -math.inf  # drawdown is measured from the first close, as with cummax()
+    mdd = 0.0
+    for i in range(n):
+        x = r[i]
+        delta = x - mean
+        mean += delta / (i + 1)
+        m2 += delta * (x - mean)
+        cum *= 1.0 + x
+        if cum > peak:
+            peak = cum
+        dd = cum / peak - 1.0
+        if dd < mdd:
+            mdd = dd
+    std = math.sqrt(m2 / n)
+    total_return = cum - 1.0
+    base = 1.0 + total_return
+    annualized_return = base ** (TRADING_DAYS / n) - 1.0 if base >= 0.0 else np.nan
+    sharpe = mean / std * math.sqrt(TRADING_DAYS) if std != 0.0 else 0.0
+    return sharpe, total_return, mdd, annualized_return, std * math.sqrt(TRADING_DAYS), n
+
+
+def _metrics_numpy(r: np.ndarray) -> tuple:
+    """Same contract as _metrics_loop, vectorized."""
+    n = r.size
+    cum = np.cumprod(1.0 + r)
+    total_return = cum[-1] - 1.0
+    with np.errstate(invalid="ignore"):
+        annualized_return = (1.0 + total_return) ** (TRADING_DAYS / n) - 1.0
+    std = r.std()
+    sharpe = r.mean() / std * math.sqrt(TRADING_DAYS) if std != 0 else 0.0
+    mdd = (cum / np.maximum.accumulate(cum) - 1.0).min()
+    return sharpe, total_return, mdd, annualized_return, std * math.sqrt(TRADING_DAYS), n
+
+
+def _combo_metrics_loop(arr: np.ndarray, combos: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """(C, 6) rows of metrics() for each combo's weighted portfolio over its NaN-free rows;
+    combos with fewer than 2 such rows are left as zeros (n == 0)."""
+    n_rows = arr.shape[0]
+    n_combos, k = combos.shape
+    out = np.zeros((n_combos, 6))
+    buf = np.empty(n_rows)
+    for i in range(n_combos):
+        # Gather, mask and weight in one pass over the rows.
+        n = 0
+        for t in range(n_rows):
+            s = 0.0
+            ok = True
+            for j in range(k):
+                x = arr[t, combos[i, j]]
+                if np.isnan(x):
+                    ok = False
+                    break
+                s += x * weights[i, j]
+            if ok:
+                buf[n] = s
+                n += 1
+        if n >= 2:
+            sharpe, total_return, mdd, annualized_return, annualized_vol, days = metrics(buf[:n])
+            out[i, 0] = sharpe
+            out[i, 1] = total_return
+            out[i, 2] = mdd
+            out[i, 3] = annualized_return
+            out[i, 4] = annualized_vol
+            out[i, 5] = days
+    return out
+
+
+if njit is not None:
+    metrics = njit(cache=True, nogil=True)(_metrics_loop)
+    combo_metrics = njit(cache=True, nogil=True)(_combo_metrics_loop)
+else:
+    metrics = _metrics_numpy
+    combo_metrics = None
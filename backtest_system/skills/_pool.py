@@ -0,0 +1,43 @@
+# Persistent process pool for CPU-bound skill work (per-period portfolio evaluation and strategy
+# optimization). It is separate from the orchestrator's strategy pool on purpose: that one is
+# capped at 2 workers to protect the market-data API and its workers carry API state, while this
+# one is sized to the cores and only computes. Created on first use, reused across calls and
+# tasks, shut down at exit.
+import atexit
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+_EXECUTOR: ProcessPoolExecutor | None = None
+_LOCK = threading.Lock()
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _EXECUTOR
+    with _LOCK:
+        if _EXECUTOR is None:
+            _EXECUTOR = ProcessPoolExecutor(max_workers=os.cpu_count() or 1)
+        return _EXECUTOR
+
+
+def shutdown() -> None:
+    """关闭常驻的计算进程池（下次调用 cpu_map 时重建）"""
+    global _EXECUTOR
+    with _LOCK:
+        executor, _EXECUTOR = _EXECUTOR, None
+    if executor is not None:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def cpu_map(fn, jobs: list) -> list:
+    """在常驻进程池中执行 fn(job)，按 jobs 顺序返回结果"""
+    try:
+        return list(_get_executor().map(fn, jobs))
+    except BrokenProcessPool:
+        # A dead worker poisons the pool; the next call starts a fresh one.
+        shutdown()
+        raise
+
+
+atexit.register(shutdown)
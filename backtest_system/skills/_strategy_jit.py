@@ -0,0 +1,294 @@
+# Bar-by-bar state machine of the threshold timing strategy, a parameter-grid evaluator on top
+# of it, the moving-average signal and the hedged-leg combination. Compiled with numba when it
+# is installed (the grid runs candidates on parallel threads); otherwise the same loops run in
+# Python over plain float lists and the signal falls back to pandas.
+import math
+
+import numpy as np
+
+try:
+    from numba import njit, prange, set_num_threads
+except ImportError:  # optional speedup; fall back to the Python loop
+    njit = None
+    prange = range
+    set_num_threads = None
+
+# True when grid_sharpe already spreads candidates over all cores (numba threads).
+PARALLEL_GRID = njit is not None
+
+
+def use_serial_grid() -> None:
+    """
+    Run grid_sharpe on one thread in this process. For strategy pool workers: positions already
+    run in parallel across the workers, and numba threads in each of them would oversubscribe.
+    """
+    if set_num_threads is not None:
+        set_num_threads(1)
+
+
+def _simulate_loop(
+    rets,
+    sig,
+    entry_th: float,
+    exit_th: float,
+    stop_loss: float,
+    th_step: float,
+    max_pos: float,
+    pos_step: float,
+    take_profit: float,
+    max_trade_dd: float,
+    cost_rate: float,
+) -> tuple:
+    """
+    (strategy daily returns as ndarray, n_trades) of the long-style state machine: enter at
+    sig <= entry_th, scale in every th_step further below, exit at sig >= exit_th. Short positions
+    run it on the mirrored inputs from _long_style; see BacktestStrategySkill._simulate_threshold_strategy.
+    """
+    n = len(rets)
+    out = np.zeros(n)
+    exposure = 0.0
+    entry_equity = 1.0
+    trade_peak = 1.0
+    trade_equity = 1.0
+    in_trade = False
+    n_trades = 0
+    n_adds = 0
+
+    for i in range(n):
+        # Apply today's return with yesterday's exposure (close->close convention).
+        r = exposure * rets[i]
+
+        # Update trade equity for risk checks.
+        trade_equity *= 1.0 + r
+        if in_trade and trade_equity > trade_peak:
+            trade_peak = trade_equity
+
+        # Decide next exposure based on today's signal (trade at close).
+        s = sig[i]
+        next_exposure = exposure
+
+        if not in_trade:
+            if s <= entry_th:
+                next_exposure = min(max_pos, pos_step)
+                in_trade = True
+                n_trades += 1
+                n_adds = 0
+                entry_equity = trade_equity
+                trade_peak = trade_equity
+        else:
+            # Scale in if signal moves further past the entry threshold in steps.
+            add = s <= entry_th - th_step * (n_adds + 1)
+            want_exit = s >= exit_th
+            if add and next_exposure < max_pos:
+                next_exposure = min(max_pos, next_exposure + pos_step)
+                n_adds += 1
+
+            trade_ret = trade_equity / entry_equity - 1.0
+            trade_dd = trade_equity / trade_peak - 1.0 if trade_peak != 0.0 else 0.0
+            if want_exit or trade_ret <= -stop_loss or trade_ret >= take_profit or trade_dd <= -max_trade_dd:
+                next_exposure = 0.0
+                in_trade = False
+
+        # Transaction cost when adjusting exposure (charged on decision day).
+        delta = abs(next_exposure - exposure)
+        if delta != 0.0:
+            r -= delta * cost_rate
+        out[i] = r
+
+        exposure = next_exposure
+
+    return out, n_trades
+
+
+def _long_style(sig, is_long: bool, low_th: float, high_th: float, rev_long: float, rev_short: float) -> tuple:
+    """
+    (sig, entry_th, exit_th) for _simulate_loop. A short entry s >= high_th is -s <= -high_th, and
+    its scale-in and exit rules mirror the same way; IEEE negation is exact, so both directions share
+    one loop with identical decisions.
+    """
+    if is_long:
+        return sig, low_th, rev_long
+    return -sig, -high_th, -rev_short
+
+
+def _ma_signal_loop(close: np.ndarray, window: int, min_periods: int) -> np.ndarray:
+    """
+    close / rolling_mean(close), inf -> NaN, back-filled, remaining NaN -> 1.0. Same running-sum
+    scheme as pandas' rolling mean (separate Kahan terms for entering/leaving values, constant
+    windows return the value itself), so the result matches Series.rolling(...).mean().
+    """
+    n = close.shape[0]
+    out = np.empty(n)
+    total = 0.0
+    comp_add = 0.0
+    comp_remove = 0.0
+    nobs = 0
+    neg_ct = 0
+    same_run = 0
+    prev = np.nan
+    for i in range(n):
+        if i >= window:
+            v = close[i - window]
+            if not np.isnan(v):
+                nobs -= 1
+                y = -v - comp_remove
+                t = total + y
+                comp_remove = t - total - y
+                total = t
+                if np.signbit(v):
+                    neg_ct -= 1
+        v = close[i]
+        if not np.isnan(v):
+            nobs += 1
+            y = v - comp_add
+            t = total + y
+            comp_add = t - total - y
+            total = t
+            if np.signbit(v):
+                neg_ct += 1
+            same_run = same_run + 1 if v == prev else 1
+            prev = v
+        if nobs >= min_periods and nobs > 0:
+            ma = total / nobs
+            if same_run >= nobs:
+                ma = prev
+            elif neg_ct == 0 and ma < 0.0:
+                ma = 0.0
+            elif neg_ct == nobs and ma > 0.0:
+                ma = 0.0
+            x = v / ma
+            out[i] = x if np.isfinite(x) else np.nan
+        else:
+            out[i] = np.nan
+    nxt = 1.0
+    for i in range(n - 1, -1, -1):
+        if np.isnan(out[i]):
+            out[i] = nxt
+        else:
+            nxt = out[i]
+    return out
+
+
+def _combine_legs_loop(panel: np.ndarray, weights: np.ndarray, total_weight: float, long_j: int, short_j: int) -> tuple:
+    """
+    (daily_return, close) of a hedged position from an (n, 2 * legs) panel of leg closes then leg
+    returns: the weighted return sum / total_weight, and the long/short leg value ratio (inf -> NaN),
+    or the weighted absolute close sum when long_j or short_j is -1. One pass over the rows.
+    """
+    n = panel.shape[0]
+    k = weights.shape[0]
+    out_ret = np.empty(n)
+    out_close = np.empty(n)
+    for i in range(n):
+        acc = 0.0
+        for j in range(k):
+            acc += panel[i, k + j] * weights[j]
+        out_ret[i] = acc / total_weight
+        if long_j < 0 or short_j < 0:
+            c = 0.0
+            for j in range(k):
+                c += panel[i, j] * abs(weights[j])
+        else:
+            num = panel[i, long_j] * abs(weights[long_j])
+            den = panel[i, short_j] * abs(weights[short_j])
+            c = num / den if den != 0.0 else np.nan
+            if np.isinf(c):
+                c = np.nan
+        out_close[i] = c
+    return out_ret, out_close
+
+
+def _combine_legs_numpy(panel: np.ndarray, weights: np.ndarray, total_weight: float, long_j: int, short_j: int) -> tuple:
+    """Same contract as _combine_legs_loop, vectorized."""
+    k = weights.shape[0]
+    closes, rets = panel[:, :k], panel[:, k:]
+    out_ret = sum(rets[:, j] * weights[j] for j in range(k)) / total_weight
+    if long_j < 0 or short_j < 0:
+        out_close = sum(closes[:, j] * abs(weights[j]) for j in range(k))
+    else:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            out_close = (closes[:, long_j] * abs(weights[long_j])) / (closes[:, short_j] * abs(weights[short_j]))
+        out_close[np.isinf(out_close)] = np.nan
+    return out_ret, out_close
+
+
+def _sharpe_loop(r: np.ndarray) -> float:
+    """Annualized Sharpe of daily returns (ddof=0); 0 for fewer than 2 rows or zero volatility."""
+    n = r.shape[0]
+    if n < 2:
+        return 0.0
+    mean = 0.0
+    for i in range(n):
+        mean += r[i]
+    mean /= n
+    var = 0.0
+    for i in range(n):
+        d = r[i] - mean
+        var += d * d
+    std = math.sqrt(var / n)
+    return mean / std * math.sqrt(252.0) if std != 0.0 else 0.0
+
+
+def _sharpe_numpy(r: np.ndarray) -> float:
+    """Same contract as _sharpe_loop, vectorized."""
+    if r.shape[0] < 2:
+        return 0.0
+    std = r.std()
+    return float(r.mean() / std * math.sqrt(252.0)) if std != 0 else 0.0
+
+
+# Kernels compile (or load from the cache=True on-disk cache) on their first call, so processes that
+# never backtest (history, web) don't pay for it.
+if njit is not None:
+    _simulate = njit(cache=True, nogil=True)(_simulate_loop)
+    _mirror = njit(cache=True, nogil=True)(_long_style)
+    ma_signal = njit(cache=True, nogil=True)(_ma_signal_loop)
+    combine_legs = njit(cache=True, nogil=True)(_combine_legs_loop)
+    _sharpe = njit(cache=True, nogil=True)(_sharpe_loop)
+
+    @njit(cache=True, nogil=True)
+    def simulate(
+        rets, sig, is_long, low_th, high_th, rev_long, rev_short,
+        stop_loss, th_step, max_pos, pos_step, take_profit, max_trade_dd, cost_rate,
+    ):
+        """(strategy daily returns, n_trades) for either direction."""
+        s, entry_th, exit_th = _mirror(sig, is_long, low_th, high_th, rev_long, rev_short)
+        return _simulate(
+            rets, s, entry_th, exit_th, stop_loss, th_step, max_pos, pos_step, take_profit, max_trade_dd, cost_rate
+        )
+
+    @njit(cache=True, parallel=True)
+    def grid_sharpe(rets, sig, is_long, params, cost_rate):
+        """Sharpe of every parameter row (columns low_th, high_th, rev_long, rev_short, stop_loss..max_trade_dd)."""
+        n_cand = params.shape[0]
+        out = np.empty(n_cand)
+        # Mirror the signal once for all candidates; each row only picks and negates its thresholds.
+        s = sig if is_long else -sig
+        entry_col, exit_col, sign = (0, 2, 1.0) if is_long else (1, 3, -1.0)
+        for k in prange(n_cand):
+            r, _ = _simulate(
+                rets, s, sign * params[k, entry_col], sign * params[k, exit_col],
+                params[k, 4], params[k, 5], params[k, 6], params[k, 7], params[k, 8], params[k, 9],
+                cost_rate,
+            )
+            out[k] = _sharpe(r)
+        return out
+
+else:
+    ma_signal = None  # callers use pandas rolling()
+    combine_legs = _combine_legs_numpy
+
+    def simulate(rets: np.ndarray, sig: np.ndarray, is_long: bool, *params) -> tuple:
+        s, entry_th, exit_th = _long_style(sig, is_long, *params[:4])
+        # Python floats index and multiply much faster than numpy scalars in a scalar loop.
+        return _simulate_loop(rets.tolist(), s.tolist(), entry_th, exit_th, *params[4:])
+
+    def grid_sharpe(rets: np.ndarray, sig: np.ndarray, is_long: bool, params: np.ndarray, cost_rate: float) -> np.ndarray:
+        """Sharpe of every parameter row (columns low_th, high_th, rev_long, rev_short, stop_loss..max_trade_dd)."""
+        rets_l = rets.tolist()
+        sig_l = (sig if is_long else -sig).tolist()
+        out = []
+        for row in params.tolist():
+            entry_th, exit_th = (row[0], row[2]) if is_long else (-row[1], -row[3])
+            out.append(_sharpe_numpy(_simulate_loop(rets_l, sig_l, entry_th, exit_th, *row[4:], cost_rate)[0]))
+        return np.array(out, dtype=np.float64)
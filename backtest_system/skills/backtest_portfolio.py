@@ -1,10 +1,55 @@
+import heapq
+import math
+import os
 import pandas as pd
 import numpy as np
 from scipy.optimize import minimize
+from functools import lru_cache
 from itertools import combinations
 from backtest_system.skills.base import BaseSkill
+from backtest_system.skills._pool import cpu_map
+from backtest_system.skills._metrics_njit import combo_metrics, metrics
 from backtest_system.core.models import SkillResult
 
+# Upper bound on floats gathered per equal-weight batch (~32 MB as float32).
+_EW_BATCH_ELEMS = 8_000_000
+
+# Equal-weight combos are screened on approximate Sharpe (float32 gather / moments) and only
+# recomputed in float64 when within this margin of the current top_n cut-off.
+_SCREEN_TOL = 1e-3
+
+# Ridge added to the mean-variance covariance, relative to its average variance (trace / k).
+_COV_RIDGE = 1e-4
+
+# Below this many (combo, model) evaluations across all periods, a process pool costs more than it saves.
+_PARALLEL_MIN_EVALS = 2000
+
+
+def _job_size(job: tuple) -> int:
+    _, _, _, positions, min_size, max_size, models, _ = job
+    n = len(positions)
+    return len(models) * sum(math.comb(n, k) for k in range(min_size, min(max_size, n) + 1))
+
+
+def _sharpe_key(metrics: dict) -> float:
+    return float(metrics.get("sharpe_ratio", 0) or 0)
+
+
+def _evaluate_period_job(job: tuple) -> dict | None:
+    """进程池入口：在子进程中评估单个周期"""
+    return BacktestPortfolioSkill()._evaluate_period(*job)
+
+
+@lru_cache(maxsize=256)
+def _to_datetime_index(dates: tuple[str, ...]) -> pd.DatetimeIndex:
+    # Positions on the same trading calendar share identical date lists, and the skill instance
+    # is reused across tasks: parse each distinct list once. Dates come from isoformat(), so the
+    # ISO8601 fast path applies; anything else falls back to pandas' inference.
+    try:
+        return pd.to_datetime(pd.Index(dates), format="ISO8601")
+    except ValueError:
+        return pd.to_datetime(pd.Index(dates))
+
 
 class BacktestPortfolioSkill(BaseSkill):
     """组合回测Skill - 不做参数优化"""
@@ -71,79 +116,60 @@ class BacktestPortfolioSkill(BaseSkill):
             else:
                 min_size, max_size = 2, len(positions_all)
 
-            period_results: dict[str, dict] = {}
-            best_overall = None
-
+            # Align every position once per period; combos then slice columns of one float
+            # matrix instead of building (and dropna-ing) a DataFrame per combo.
+            jobs = []
             for period in periods_to_run:
                 returns_series = {}
                 for position, pr in per_position_period.items():
                     item = pr.get(period)
                     if not item:
                         continue
-                    dates = item.get("dates") or []
-                    rets = item.get("daily_returns") or []
-                    if not dates or not rets or len(dates) != len(rets):
+                    dates = item.get("dates")
+                    rets = item.get("daily_returns")
+                    if dates is None or rets is None:
                         continue
-                    idx = pd.to_datetime(pd.Index(dates))
-                    s = pd.Series(pd.Series(rets, dtype=float).values, index=idx, dtype=float)
+                    rets = np.asarray(rets, dtype=np.float64)
+                    # A single row can never form a combo (metrics need at least 2 common rows).
+                    if rets.ndim != 1 or rets.size < 2 or rets.size != len(dates):
+                        continue
+                    idx = _to_datetime_index(tuple(dates))
+                    s = pd.Series(rets, index=idx)
                     # Some data sources may contain duplicate trade_date rows; pandas alignment
                     # will fail later unless we de-duplicate the index.
                     if not s.index.is_unique:
                         s = s[~s.index.duplicated(keep="last")]
-                    returns_series[position] = s.sort_index()
+                    returns_series[position] = s
 
                 if len(returns_series) < 2:
                     continue
 
-                all_results = []
-                usable_positions = list(returns_series.keys())
-                for size in range(min_size, min(max_size + 1, len(usable_positions) + 1)):
-                    for combo in combinations(usable_positions, size):
-                        combo_returns = pd.DataFrame({p: returns_series[p] for p in combo}).dropna(how="any")
-                        if len(combo_returns) < 2:
-                            continue
-                        for model in portfolio_models:
-                            weights = self._get_weights(combo_returns, model)
-                            portfolio_returns = combo_returns.dot(weights)
-                            metrics = self._calculate_metrics(portfolio_returns)
-                            all_results.append({
-                                "period": period,
-                                "positions": list(combo),
-                                "model": model,
-                                "weights": dict(zip(combo, weights.tolist())),
-                                "metrics": metrics,
-                            })
-
-                all_results.sort(key=lambda x: float(x["metrics"].get("sharpe_ratio", 0) or 0), reverse=True)
-                if not all_results:
-                    continue
+                # concat aligns by label, so inputs need no sorting; sort the union once, and only
+                # when it is not already in order (the usual case for daily bars).
+                aligned = pd.concat(returns_series, axis=1)
+                if not aligned.index.is_monotonic_increasing:
+                    aligned = aligned.sort_index()
+                jobs.append((
+                    period,
+                    aligned.to_numpy(dtype=np.float64),
+                    aligned.index,
+                    list(aligned.columns),
+                    min_size,
+                    max_size,
+                    list(portfolio_models),
+                    top_n,
+                ))
 
-                top = all_results[: max(1, int(top_n))] if top_n else all_results
-                best = all_results[0]
-
-                # Recompute best returns for storage/report.
-                best_combo = best["positions"]
-                best_model = best["model"]
-                combo_returns = pd.DataFrame({p: returns_series[p] for p in best_combo}).dropna(how="any")
-                weights = self._get_weights(combo_returns, best_model)
-                portfolio_returns = combo_returns.dot(weights)
-
-                period_results[period] = {
-                    "best": {
-                        **best,
-                        "dates": [d.isoformat() for d in portfolio_returns.index.to_pydatetime()],
-                        "portfolio_returns": [float(x) for x in portfolio_returns.values],
-                    },
-                    "top": top,
-                }
-
-                if best_overall is None:
-                    best_overall = period_results[period]["best"]
-                else:
-                    if float(best["metrics"].get("sharpe_ratio", 0) or 0) > float(
-                        best_overall["metrics"].get("sharpe_ratio", 0) or 0
-                    ):
-                        best_overall = period_results[period]["best"]
+            period_results: dict[str, dict] = {}
+            best_overall = None
+            for job, outcome in zip(jobs, self._run_periods(jobs)):
+                if outcome is None:
+                    continue
+                period = job[0]
+                period_results[period] = outcome
+                best = outcome["best"]
+                if best_overall is None or _sharpe_key(best["metrics"]) > _sharpe_key(best_overall["metrics"]):
+                    best_overall = best
 
             if not period_results or not best_overall:
                 return SkillResult(success=False, error="无法生成有效组合")
@@ -166,51 +192,322 @@ class BacktestPortfolioSkill(BaseSkill):
         except Exception as e:
             return SkillResult(success=False, error=str(e))
 
-    def _get_weights(self, returns_df: pd.DataFrame, model: str) -> np.ndarray:
-        """根据模型获取权重"""
-        num_strats = returns_df.shape[1]
+    def _run_periods(self, jobs: list[tuple]) -> list:
+        """各周期互不依赖：组合数足够多时分发到常驻计算进程池，否则串行（避免进程间传输开销）"""
+        workers = min(len(jobs), os.cpu_count() or 1)
+        if workers > 1 and sum(_job_size(job) for job in jobs) >= _PARALLEL_MIN_EVALS:
+            return cpu_map(_evaluate_period_job, jobs)
+        return [self._evaluate_period(*job) for job in jobs]
+
+    def _evaluate_period(
+        self,
+        period: str,
+        arr: np.ndarray,
+        index: pd.DatetimeIndex,
+        usable_positions: list[str],
+        min_size: int,
+        max_size: int,
+        portfolio_models: list[str],
+        top_n: int | None,
+    ) -> dict | None:
+        """单周期：枚举组合并按 Sharpe 排序，返回 {"best", "top"}；无有效组合时返回 None"""
+        valid = ~np.isnan(arr)
+        # Columns with data on every row; combos made only of these need no row mask.
+        complete = valid.all(axis=0)
+
+        # Scratch buffer for per-combo portfolio returns; metrics only read it, never keep it.
+        out_buf = np.empty(arr.shape[0], dtype=np.float64)
+        # Keep only the top_n candidates while enumerating (min-heap on (sharpe, -seq), so equal
+        # Sharpe ties keep enumeration order); result dicts are built for survivors only.
+        limit = max(1, int(top_n)) if top_n else None
+        ranked: list[tuple] = []
+        seq = 0
+        # equal_weight is screened per combo size below; other models are evaluated per size into
+        # (C, 6) metric rows, and result dicts are only built for combos that enter the heap.
+        weighted_models = [m for m in portfolio_models if m != "equal_weight"]
+        stats = self._annualized_moments(arr, complete) if "mean_variance" in weighted_models else None
+        moments = self._return_moments(arr, valid) if "equal_weight" in portfolio_models else None
+        # Half-width copy for the per-combo gathers; only combos with gaps read it.
+        arr32 = arr.astype(np.float32) if moments is not None and not complete.all() else None
+        for size in range(min_size, min(max_size + 1, len(usable_positions) + 1)):
+            combos = list(combinations(range(len(usable_positions)), size))
+            ew_sharpe = (
+                self._equal_weight_sharpes(arr32, valid, complete, combos, moments) if moments is not None else None
+            )
+            model_rows, model_weights = self._weighted_combo_metrics(
+                arr, valid, complete, combos, weighted_models, out_buf, stats
+            )
+            for ci, cols in enumerate(combos):
+                cols = list(cols)
+                for model in portfolio_models:
+                    if model == "equal_weight":
+                        if ew_sharpe[ci] is None:
+                            continue
+                        weights = None
+                        # Screening Sharpe only: skip the float64 return path unless it may make the top_n.
+                        if limit is not None and len(ranked) >= limit and ew_sharpe[ci] + _SCREEN_TOL < ranked[0][0]:
+                            seq += 1
+                            continue
+                        _, combo_ew = self._combo_matrix(arr, valid, complete, cols)
+                        metrics = self._calculate_metrics(combo_ew.mean(axis=1))
+                        key = _sharpe_key(metrics)
+                    else:
+                        row = model_rows[model][ci]
+                        if row[5] < 2:
+                            continue
+                        key = float(row[0] or 0)
+                        if limit is not None and len(ranked) >= limit and (key, -seq) <= ranked[0][:2]:
+                            seq += 1
+                            continue
+                        weights = model_weights[model][ci]
+                        metrics = self._metrics_dict(row)
+                    item = (key, -seq, cols, model, weights, metrics)
+                    seq += 1
+                    if limit is None or len(ranked) < limit:
+                        heapq.heappush(ranked, item)
+                    elif item[:2] > ranked[0][:2]:
+                        heapq.heapreplace(ranked, item)
+
+        if not ranked:
+            return None
+
+        top = []
+        best_cols = best_weights = None
+        for _, _, cols, model, weights, metrics in sorted(ranked, key=lambda t: t[:2], reverse=True):
+            combo = [usable_positions[c] for c in cols]
+            if weights is None:
+                weights = np.array([1.0 / len(cols)] * len(cols))
+            if best_cols is None:
+                best_cols, best_weights = cols, weights
+            top.append({
+                "period": period,
+                "positions": combo,
+                "model": model,
+                "weights": dict(zip(combo, weights.tolist())),
+                "metrics": metrics,
+            })
+        best = top[0]
+
+        # Best returns for storage/report, reusing the weights found during enumeration.
+        rows_ok, combo_returns = self._combo_matrix(arr, valid, complete, best_cols)
+        best_index = index if rows_ok is None else index[rows_ok]
+
+        return {
+            "best": {
+                **best,
+                # Same text as Timestamp.isoformat() for these second-resolution dates, formatted in C.
+                "dates": best_index.strftime("%Y-%m-%dT%H:%M:%S").tolist(),
+                "portfolio_returns": (combo_returns @ best_weights).tolist(),
+            },
+            "top": top,
+        }
+
+    @staticmethod
+    def _combo_matrix(
+        arr: np.ndarray, valid: np.ndarray, complete: np.ndarray, cols: list[int]
+    ) -> tuple[np.ndarray | None, np.ndarray]:
+        """组合收益矩阵：只保留所有成员都有数据的行，返回 (行掩码或None, T'×k 矩阵)"""
+        if complete[cols].all():
+            return None, arr.take(cols, axis=1)
+        rows_ok = valid[:, cols].all(axis=1)
+        return rows_ok, arr[np.ix_(rows_ok, cols)]
+
+    @staticmethod
+    def _return_moments(arr: np.ndarray, valid: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """每列收益之和 S1 与交叉乘积矩阵 X = AᵀA（缺失按0计，仅对无缺失的列组合有效）"""
+        filled = np.where(valid, arr, 0.0)
+        return filled.sum(axis=0), filled.T @ filled
+
+    def _equal_weight_sharpes(
+        self,
+        arr32: np.ndarray | None,
+        valid: np.ndarray,
+        complete: np.ndarray,
+        combos: list[tuple[int, ...]],
+        moments: tuple[np.ndarray, np.ndarray],
+    ) -> list:
+        """
+        同一大小的所有组合批量估算等权 Sharpe（用于筛选，精确指标由调用方按需以 float64 计算）。
+        返回与 combos 对齐的列表，有效行不足2行的组合为 None：
+        - 成员都无缺失的组合：由 S1/X 直接得到；
+        - 其余组合：一次取出 (T, C, k) 的 float32 列，按各自有效行求均值/方差。
+        """
+        if not combos:
+            return []
+        idx_all = np.asarray(combos, dtype=np.intp)
+        n_rows, k = valid.shape[0], idx_all.shape[1]
+        out: list = [None] * len(combos)
+
+        # Equal-weight portfolio r_p = mean_k(r_i): its mean is ΣS1[c]/(kT) and its second moment
+        # is ΣX[c,c]/(k²T), so Sharpe needs a k×k slice per combo instead of a T×k pass.
+        full = complete[idx_all].all(axis=1)
+        if n_rows >= 2 and full.any():
+            s1, cross = moments
+            idx = idx_all[full]
+            mean = s1[idx].sum(axis=1) / (k * n_rows)
+            second = cross[idx[:, :, None], idx[:, None, :]].sum(axis=(1, 2)) / (k * k * n_rows)
+            for j, value in zip(np.flatnonzero(full).tolist(), self._sharpe_from_moments(mean, second).tolist()):
+                out[j] = value
+
+        rest = np.flatnonzero(~full)
+        # Tile combos so each (T, C, k) gather stays around _EW_BATCH_ELEMS floats.
+        batch = max(1, _EW_BATCH_ELEMS // max(1, n_rows * k))
+        for start in range(0, len(rest), batch):
+            pos = rest[start : start + batch]
+            idx = idx_all[pos]
+            rows_ok = valid[:, idx].all(axis=2)
+            port = np.where(rows_ok, arr32[:, idx].mean(axis=2), 0.0)
+            n = rows_ok.sum(axis=0)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                mean = port.sum(axis=0, dtype=np.float64) / n
+                second = np.square(port).sum(axis=0, dtype=np.float64) / n
+            for j, value in zip(pos.tolist(), self._sharpe_from_moments(mean, second).tolist()):
+                out[j] = value
+            for j in pos[n < 2].tolist():
+                out[j] = None
+        return out
+
+    @staticmethod
+    def _sharpe_from_moments(mean: np.ndarray, second: np.ndarray) -> np.ndarray:
+        std = np.sqrt(np.maximum(second - mean * mean, 0.0))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(std > 0, mean / std * np.sqrt(252), 0.0)
+
+    def _weighted_combo_metrics(
+        self,
+        arr: np.ndarray,
+        valid: np.ndarray,
+        complete: np.ndarray,
+        combos: list[tuple[int, ...]],
+        models: list[str],
+        out_buf: np.ndarray,
+        stats: tuple[np.ndarray, np.ndarray] | None = None,
+    ) -> tuple[dict[str, np.ndarray], dict[str, list]]:
+        """
+        非等权模型：逐组合求权重，返回 ({model: (C, 6) 绩效行}, {model: 权重列表})。
+        绩效行顺序同 metrics()，n_days<2 表示有效行不足（权重为 None）。
+        stats 为周期级的年化均值/协方差（见 _annualized_moments），无缺失的组合直接切片使用。
+        安装 numba 时，加权求和与绩效计算由编译内核对同一大小的全部组合一次完成。
+        """
+        rows = {m: np.zeros((len(combos), 6)) for m in models}
+        weights: dict[str, list] = {m: [None] * len(combos) for m in models}
+        if not models or not combos:
+            return rows, weights
+        for ci, cols in enumerate(combos):
+            rows_ok, combo_returns = self._combo_matrix(arr, valid, complete, list(cols))
+            if len(combo_returns) < 2:
+                continue
+            combo_stats = None
+            if stats is not None and rows_ok is None:
+                combo_stats = (stats[0][list(cols)], stats[1][np.ix_(cols, cols)])
+            for model in models:
+                w = self._get_weights(combo_returns, model, combo_stats)
+                weights[model][ci] = w
+                if combo_metrics is None:
+                    rows[model][ci] = metrics(np.matmul(combo_returns, w, out=out_buf[: len(combo_returns)]))
+        if combo_metrics is not None:
+            idx = np.asarray(combos, dtype=np.intp)
+            zeros = np.zeros(idx.shape[1])
+            for model in models:
+                w_all = np.array([zeros if w is None else w for w in weights[model]])
+                rows[model] = combo_metrics(arr, idx, w_all)
+        return rows, weights
+
+    @staticmethod
+    def _annualized_moments(arr: np.ndarray, complete: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        周期级年化均值 (N,) 与协方差 (N, N)：对无缺失的列一次 Xᵀ X 求得，其余列为 NaN
+        （含缺失的组合有效行各不相同，仍需逐组合计算）。
+        """
+        n_cols = arr.shape[1]
+        mean = np.full(n_cols, np.nan)
+        cov = np.full((n_cols, n_cols), np.nan)
+        cols = np.flatnonzero(complete)
+        if arr.shape[0] >= 2 and cols.size:
+            sub = arr.take(cols, axis=1)
+            col_mean = sub.mean(axis=0)
+            centered = sub - col_mean
+            mean[cols] = col_mean * 252
+            cov[np.ix_(cols, cols)] = (centered.T @ centered) / (arr.shape[0] - 1) * 252
+        return mean, cov
+
+    def _get_weights(
+        self, returns: np.ndarray, model: str, stats: tuple[np.ndarray, np.ndarray] | None = None
+    ) -> np.ndarray:
+        """根据模型获取权重（returns: T×k，已剔除缺失行；stats: 可选的预计算年化均值/协方差）"""
+        num_strats = returns.shape[1]
         if model == "equal_weight":
             return np.array([1.0 / num_strats] * num_strats)
         elif model == "mean_variance":
-            return self._optimize_weights(returns_df)
+            return self._optimize_weights(returns, stats)
         return np.array([1.0 / num_strats] * num_strats)
 
-    def _optimize_weights(self, returns_df: pd.DataFrame) -> np.ndarray:
+    def _optimize_weights(
+        self, returns: np.ndarray, stats: tuple[np.ndarray, np.ndarray] | None = None
+    ) -> np.ndarray:
         """均值-方差优化"""
-        returns_df = returns_df.dropna(how="any")
-        if len(returns_df) < 2:
-            num_strats = returns_df.shape[1]
+        num_strats = returns.shape[1]
+        if len(returns) < 2:
             return np.array([1.0 / num_strats] * num_strats) if num_strats else np.array([])
 
-        num_strats = returns_df.shape[1]
-        mean_returns = returns_df.mean() * 252
-        cov_matrix = returns_df.cov() * 252
+        if stats is not None:
+            mean_returns, cov_matrix = stats
+        else:
+            mean_returns = returns.mean(axis=0) * 252
+            cov_matrix = np.cov(returns, rowvar=False) * 252
+        # Ridge keeps Σ positive definite when strategies are collinear (e.g. related sub-strategies),
+        # so the closed form is solvable and every feasible portfolio has positive volatility.
+        scale = np.trace(cov_matrix) / num_strats
+        cov_matrix = cov_matrix + _COV_RIDGE * (scale if scale > 0 else 1.0) * np.eye(num_strats)
+        init_guess = np.array([1.0 / num_strats] * num_strats)
+
+        # Closed form first: the unconstrained max-Sharpe (tangency) direction is Σ⁻¹μ. When it is
+        # already long-only it is also the optimum under the 0<=w<=1, Σw=1 constraints.
+        try:
+            x = np.linalg.solve(cov_matrix, mean_returns)
+        except np.linalg.LinAlgError:
+            x = None
+        if x is not None and np.all(np.isfinite(x)) and np.all(x >= 0) and x.sum() > 0:
+            return x / x.sum()
 
+        # Otherwise a bound is active: fall back to SLSQP on plain ndarrays with an analytic gradient.
         def neg_sharpe(weights):
-            port_return = np.dot(weights, mean_returns)
-            port_vol = np.sqrt(np.dot(weights.T, np.dot(cov_matrix, weights)))
-            return -(port_return / port_vol) if port_vol != 0 else 0
+            port_return = weights @ mean_returns
+            port_vol = np.sqrt(weights @ cov_matrix @ weights)
+            return -(port_return / port_vol)
+
+        def neg_sharpe_jac(weights):
+            cov_w = cov_matrix @ weights
+            port_var = weights @ cov_w
+            port_vol = np.sqrt(port_var)
+            port_return = weights @ mean_returns
+            return -(mean_returns / port_vol - port_return * cov_w / (port_var * port_vol))
 
         constraints = {'type': 'eq', 'fun': lambda x: np.sum(x) - 1}
         bounds = tuple((0, 1) for _ in range(num_strats))
-        init_guess = np.array([1.0 / num_strats] * num_strats)
 
-        result = minimize(neg_sharpe, init_guess, method='SLSQP', bounds=bounds, constraints=constraints)
+        result = minimize(
+            neg_sharpe,
+            init_guess,
+            jac=neg_sharpe_jac,
+            method='SLSQP',
+            bounds=bounds,
+            constraints=constraints,
+        )
         return result.x if result.success else init_guess
 
-    def _calculate_metrics(self, returns: pd.Series) -> dict:
+    def _calculate_metrics(self, returns: np.ndarray) -> dict:
         """计算绩效指标"""
-        returns = returns.dropna()
+        returns = returns[~np.isnan(returns)]
         if len(returns) < 2:
             return {"sharpe_ratio": 0.0, "total_return": 0.0, "max_drawdown": 0.0, "annualized_return": 0.0, "annualized_volatility": 0.0}
 
-        cum_returns = (1 + returns).cumprod()
-        total_return = cum_returns.iloc[-1] - 1
-        annualized_return = (1 + total_return) ** (252 / len(returns)) - 1
-        std = returns.std(ddof=0)
-        annualized_vol = std * np.sqrt(252)
-        sharpe_ratio = (returns.mean() / std) * np.sqrt(252) if std != 0 else 0.0
-        max_drawdown = (cum_returns / cum_returns.cummax() - 1).min()
+        return self._metrics_dict(metrics(returns))
+
+    @staticmethod
+    def _metrics_dict(values) -> dict:
+        """metrics() 的结果（元组或 (6,) 行）转为指标字典"""
+        sharpe_ratio, total_return, max_drawdown, annualized_return, annualized_vol, n_days = values
 
         return {
             "sharpe_ratio": float(sharpe_ratio),
@@ -218,5 +515,5 @@ class BacktestPortfolioSkill(BaseSkill):
             "max_drawdown": float(max_drawdown),
             "annualized_return": float(annualized_return),
             "annualized_volatility": float(annualized_vol),
-            "n_days": int(len(returns)),
+            "n_days": int(n_days),
         }
@@ -2,11 +2,25 @@ import pandas as pd
 import numpy as np
 import re
 import hashlib
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
 from datetime import date, timedelta
-from itertools import product
-from typing import Iterable, Optional
+from functools import lru_cache, reduce
+from typing import Optional
 
 from backtest_system.skills.base import BaseSkill
+from backtest_system.skills._pool import cpu_map
+from backtest_system.skills._metrics_njit import metrics
+from backtest_system.skills._strategy_jit import (
+    PARALLEL_GRID,
+    combine_legs,
+    grid_sharpe,
+    ma_signal,
+    simulate,
+    use_serial_grid,
+)
 from backtest_system.core.models import SkillResult
 from backtest_system.core.exceptions import DataValidationError, NetworkError
 
@@ -18,7 +32,35 @@ def parse_position(position: str) -> dict:
     - '多l-v:1:1' -> 做多L市值1份，做空V市值1份，总市值2份
     - '多l-v:2:1' -> 做多L市值2份，做空V市值1份，总市值3份
     """
+    direction, symbols, total_weight = _parse_position_cached(position)
+    # Fresh dict/list per call: the cached tuple is shared, callers may hold on to the result.
+    return {'direction': direction, 'symbols': list(symbols), 'total_weight': total_weight}
+
+
+# Canonical position strings ('多AU', '空AU:2', '多L-V:2:1'); anything else takes the split() path.
+_POSITION_RE = re.compile(
+    r"(?P<dir>[多空])?(?P<a>[A-Za-z0-9]+)(?:-(?P<b>[A-Za-z0-9]+))?"
+    r"(?::(?P<ra>\d+(?:\.\d+)?))?(?::(?P<rb>\d+(?:\.\d+)?))?"
+)
+
+
+@lru_cache(maxsize=1024)
+def _parse_position_cached(position: str) -> tuple[str, tuple[tuple[str, float], ...], float]:
+    # The same position string is parsed by validate_data, the orchestrator and every strategy
+    # worker; memoize the pure parse and let parse_position build the dict view.
     position = position.strip()
+    m = _POSITION_RE.fullmatch(position)
+    if m is None:
+        return _parse_position_split(position)
+
+    direction = 'short' if m['dir'] == '空' else 'long'
+    ratio_a = float(m['ra']) if m['ra'] else 1.0
+    ratio_b = float(m['rb']) if m['rb'] else 1.0
+    return _position_tuple(direction, m['a'].upper(), m['b'] and m['b'].upper(), ratio_a, ratio_b)
+
+
+def _parse_position_split(position: str) -> tuple[str, tuple[tuple[str, float], ...], float]:
+    # Lenient fallback for non-canonical input (spaces around symbols, exotic ratio literals).
     if position.startswith('多'):
         direction = 'long'
         rest = position[1:]
@@ -32,26 +74,48 @@ def parse_position(position: str) -> dict:
     # 解析比例（冒号分隔）
     parts = rest.split(':')
     symbols_part = parts[0]
+    ratio_a = float(parts[1]) if len(parts) > 1 else 1.0
 
     if '-' in symbols_part:
-        # 对冲头寸
         sym_parts = symbols_part.split('-')
-        sym_a = sym_parts[0].strip().upper()
-        sym_b = sym_parts[1].strip().upper()
-        ratio_a = float(parts[1]) if len(parts) > 1 else 1.0
         ratio_b = float(parts[2]) if len(parts) > 2 else 1.0
+        return _position_tuple(
+            direction, sym_parts[0].strip().upper(), sym_parts[1].strip().upper(), ratio_a, ratio_b
+        )
+    return _position_tuple(direction, symbols_part.strip().upper(), None, ratio_a, 1.0)
+
+
+def _position_tuple(
+    direction: str, sym_a: str, sym_b: Optional[str], ratio_a: float, ratio_b: float
+) -> tuple[str, tuple[tuple[str, float], ...], float]:
+    if sym_b is not None:
+        # 对冲头寸
         total_weight = ratio_a + ratio_b
         if direction == 'long':
-            return {'direction': direction, 'symbols': [(sym_a, ratio_a), (sym_b, -ratio_b)], 'total_weight': total_weight}
+            return direction, ((sym_a, ratio_a), (sym_b, -ratio_b)), total_weight
         else:
-            return {'direction': direction, 'symbols': [(sym_a, -ratio_a), (sym_b, ratio_b)], 'total_weight': total_weight}
+            return direction, ((sym_a, -ratio_a), (sym_b, ratio_b)), total_weight
     else:
         # 单品种
-        sym = symbols_part.strip().upper()
-        ratio = float(parts[1]) if len(parts) > 1 else 1.0
-        weight = ratio if direction == 'long' else -ratio
-        return {'direction': direction, 'symbols': [(sym, weight)], 'total_weight': ratio}
-
+        weight = ratio_a if direction == 'long' else -ratio_a
+        return direction, ((sym_a, weight),), ratio_a
+
+
+_REQUIRED_LEG_COLUMNS = frozenset({"trade_date", "close_ba"})
+
+# Strategy parameters in the positional order of _strategy_jit.simulate, with their defaults.
+_SIM_PARAMS = (
+    ("low_threshold", 1.02),
+    ("high_threshold", 1.45),
+    ("reverse_long_threshold", 1.12),
+    ("reverse_short_threshold", 1.08),
+    ("stop_loss_pct", 0.02),
+    ("threshold_adjust_pct", 0.05),
+    ("max_position_pct", 1.0),
+    ("position_increase_pct", 0.2),
+    ("profit_threshold_pct", 0.2),
+    ("drawdown_threshold_pct", 0.3),
+)
 
 _PERIOD_RE = re.compile(r"^\s*(?P<num>\d+)\s*(?P<unit>[ymd])\s*$", re.IGNORECASE)
 
@@ -81,21 +145,102 @@ def _to_py(v):
     return v.item() if isinstance(v, np.generic) else v
 
 
+# Per-process DatabaseAPI for strategy workers, built once by _init_optimization_worker so the
+# API config is pickled once per worker (not per task) and the HTTP session/read cache are reused
+# across all positions the worker handles.
+_WORKER_DB_API = None
+
+
+def _init_optimization_worker(api_config: object, cache_dir: str | None = None) -> None:
+    """ProcessPoolExecutor initializer: build the worker's DatabaseAPI once."""
+    global _WORKER_DB_API
+    from backtest_system.core.database import DatabaseAPI
+
+    _WORKER_DB_API = DatabaseAPI(None, api_config, cache_dir=cache_dir)
+    # Workers already run positions in parallel; keep each one's parameter grid on one thread.
+    use_serial_grid()
+
+
+def _leg_arrays(sym: str, data: list[dict]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """单腿原始行 -> 按日期升序、同日只保留最后一行的 (dates, close, daily_return) 数组"""
+    # Only the columns the strategy uses are read; rows carry many unused fields.
+    sample = data[0]
+    missing = _REQUIRED_LEG_COLUMNS.difference(sample)
+    if missing:
+        raise DataValidationError(f"{sym} 缺少必需字段: {sorted(missing)}")
+
+    n = len(data)
+    dates = pd.to_datetime([r.get("trade_date") for r in data]).to_numpy()
+    close = np.fromiter((r.get("close_ba") for r in data), dtype=np.float64, count=n)
+    ret = (
+        np.fromiter((r.get("daily_return") for r in data), dtype=np.float64, count=n)
+        if "daily_return" in sample
+        else None
+    )
+
+    order = np.argsort(dates, kind="stable")
+    dates, close = dates[order], close[order]
+    # Defensive: some upstreams may return duplicate trade_date rows; keep the last.
+    last = np.append(dates[1:] != dates[:-1], True)
+    dates, close = dates[last], close[last]
+    if ret is not None:
+        ret = ret[order][last]
+    else:
+        ret = np.empty_like(close)
+        ret[:1] = np.nan
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ret[1:] = close[1:] / close[:-1] - 1.0
+    return dates, close, ret
+
+
+# Frames built by _load_data, keyed by position and tied to the identity of the raw row lists they
+# were built from (kept referenced here so the identity stays meaningful). A refreshed read-cache
+# entry is a new list, so it misses naturally.
+_FRAME_MEMO: "OrderedDict[str, tuple[tuple, pd.DataFrame]]" = OrderedDict()
+_FRAME_MEMO_SIZE = 64
+_FRAME_MEMO_LOCK = threading.Lock()
+
+
+def _frame_memo_get(position: str, legs: tuple) -> Optional[pd.DataFrame]:
+    with _FRAME_MEMO_LOCK:
+        entry = _FRAME_MEMO.get(position)
+        if entry is None or len(entry[0]) != len(legs) or any(a is not b for a, b in zip(entry[0], legs)):
+            return None
+        _FRAME_MEMO.move_to_end(position)
+        return entry[1]
+
+
+def _frame_memo_put(position: str, legs: tuple, frame: pd.DataFrame) -> None:
+    if any(rows is None for rows in legs):
+        return
+    with _FRAME_MEMO_LOCK:
+        _FRAME_MEMO[position] = (legs, frame)
+        _FRAME_MEMO.move_to_end(position)
+        while len(_FRAME_MEMO) > _FRAME_MEMO_SIZE:
+            _FRAME_MEMO.popitem(last=False)
+
+
 def _run_optimization_pure(
     position: str,
     periods: list[str],
     direction: str,
-    api_config: object,
-    max_evals: int,
+    api_config: object = None,
+    max_evals: int = 2000,
+    cache_dir: str | None = None,
 ) -> dict:
     """
     纯函数：在子进程中重建必要组件
     返回 JSON 可序列化的结果
+
+    Workers started with _init_optimization_worker reuse their DatabaseAPI; otherwise one is
+    built from `api_config`.
     """
-    from backtest_system.core.database import DatabaseAPI
+    db_api = _WORKER_DB_API
+    if db_api is None:
+        from backtest_system.core.database import DatabaseAPI
 
-    # 子进程里新建 DatabaseAPI（包括 Session）
-    db_api = DatabaseAPI(None, api_config)
+        # 子进程里新建 DatabaseAPI（包括 Session）
+        db_api = DatabaseAPI(None, api_config, cache_dir=cache_dir)
     skill = BacktestStrategySkill(db_api)
     
     # 执行回测
@@ -120,6 +265,36 @@ def _run_optimization_pure(
         return {"position": position, "error": result.error}
 
 
+def _run_optimization_star(args: tuple) -> dict:
+    """
+    executor.map 适配：解包 (position, periods, direction, max_evals)，
+    并把异常转成 {"error": ...}，避免一个头寸失败中断整批结果
+    """
+    position, periods, direction, max_evals = args
+    try:
+        return _run_optimization_pure(position, periods, direction, max_evals=max_evals)
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def _run_specified_star(args: tuple):
+    """
+    指定模式 worker：(position, periods, params, max_evals) -> 完整 SkillResult
+    异常（如 NetworkError）原样返回，由主进程按 Supervisor 的重试逻辑处理
+    """
+    position, periods, params, max_evals = args
+    try:
+        skill = BacktestStrategySkill(_WORKER_DB_API)
+        return skill.execute(position=position, periods=periods, params=params, max_evals=max_evals)
+    except Exception as e:
+        return e
+
+
+def _period_result_job(job: tuple) -> dict:
+    """进程池入口：在子进程中优化并回测单个周期 (df, direction, params, max_evals)"""
+    return BacktestStrategySkill(None)._period_result(*job)
+
+
 class BacktestStrategySkill(BaseSkill):
     """单策略参数优化和回测Skill"""
 
@@ -177,25 +352,22 @@ class BacktestStrategySkill(BaseSkill):
                 buffer = timedelta(days=120)
                 load_start = (date.today() - (max(deltas) + buffer)).isoformat()
 
-            df_full = self._load_data(position, start_date=load_start, end_date=load_end, limit=10000)
+            df_full = self._load_data(
+                position, start_date=load_start, end_date=load_end, limit=10000, parsed=parsed
+            )
             if df_full is None or len(df_full) < 3:
                 return SkillResult(success=False, error=f"无法加载 {position} 的数据")
 
-            period_results: dict[str, dict] = {}
+            jobs = []
             for period in periods:
                 df = self._slice_period(df_full, period)
                 if df is None or len(df) < 3:
                     continue
+                jobs.append((period, (df, direction, params, max_evals)))
 
-                best_params = params if params else self._optimize_params(df, direction=direction, max_evals=max_evals)
-                metrics, daily_returns = self._run_backtest(df, best_params, direction=direction)
-
-                period_results[period] = {
-                    "best_params": {k: _to_py(v) for k, v in (best_params or {}).items()},
-                    "metrics": metrics,
-                    "dates": [d.isoformat() for d in daily_returns.index.to_pydatetime()],
-                    "daily_returns": [float(x) for x in daily_returns.values],
-                }
+            period_results: dict[str, dict] = dict(
+                zip([period for period, _ in jobs], self._run_periods([job for _, job in jobs]))
+            )
 
             if not period_results:
                 return SkillResult(success=False, error=f"{position} 无可用周期数据")
@@ -228,6 +400,36 @@ class BacktestStrategySkill(BaseSkill):
         except Exception as e:
             return SkillResult(success=False, error=str(e))
 
+    def _run_periods(self, jobs: list[tuple]) -> list[dict]:
+        """
+        各周期的参数优化互不依赖：在主进程中、需要优化多个周期且 numba 网格内核未占满多核时
+        分发到常驻计算进程池；已在 worker 进程里（编排器按头寸并行）或指定参数时串行。
+        """
+        workers = min(len(jobs), os.cpu_count() or 1)
+        if (
+            workers > 1
+            and not PARALLEL_GRID
+            and multiprocessing.parent_process() is None
+            and not any(params for _, _, params, _ in jobs)
+        ):
+            return cpu_map(_period_result_job, jobs)
+        return [self._period_result(*job) for job in jobs]
+
+    def _period_result(self, df: pd.DataFrame, direction: str, params: dict | None, max_evals: int) -> dict:
+        """单周期：(按需)优化参数并回测，返回可 JSON 序列化的周期结果"""
+        # Returns and signal do not depend on the parameters: derive them once per period.
+        inputs = self._strategy_inputs(df)
+        best_params = params if params else self._optimize_params(df, inputs, direction=direction, max_evals=max_evals)
+        period_metrics, daily_returns = self._run_backtest(df.index, inputs, best_params, direction=direction)
+
+        return {
+            "best_params": {k: _to_py(v) for k, v in (best_params or {}).items()},
+            "metrics": period_metrics,
+            # Same text as Timestamp.isoformat() for the (midnight, tz-naive) daily bars.
+            "dates": daily_returns.index.strftime("%Y-%m-%dT%H:%M:%S").tolist(),
+            "daily_returns": daily_returns.to_numpy(dtype=np.float64).tolist(),
+        }
+
     def _slice_period(self, df: pd.DataFrame, period: str) -> pd.DataFrame:
         df = df.sort_index()
         delta = _period_to_timedelta(period)
@@ -244,79 +446,89 @@ class BacktestStrategySkill(BaseSkill):
         start_date: str | None = None,
         end_date: str | None = None,
         limit: int | None = None,
+        parsed: dict | None = None,
     ) -> pd.DataFrame:
-        """通过API加载连续合约数据，支持单品种和对冲头寸（按合约价值比例）"""
-        parsed = parse_position(position)
+        """通过API加载连续合约数据，支持单品种和对冲头寸（按合约价值比例）；parsed 为调用方已解析的头寸"""
+        if parsed is None:
+            parsed = parse_position(position)
         symbols = parsed["symbols"]
         total_weight = float(parsed["total_weight"]) if parsed.get("total_weight") else 1.0
 
-        dfs: dict[str, pd.DataFrame] = {}
+        raw = self.db_api.get_continuous_many(
+            [sym for sym, _ in symbols],
+            start_date=start_date,
+            end_date=end_date,
+            limit=limit,
+        )
+        # Raw rows come from the DatabaseAPI read cache (TTL/revalidation handled there); while it
+        # hands back the same row lists, the frame built from them is reused as-is.
+        legs = tuple(raw.get(sym) for sym, _ in symbols)
+        cached = _frame_memo_get(position, legs)
+        if cached is not None:
+            return cached
+        result = self._build_frame(position, symbols, total_weight, raw)
+        _frame_memo_put(position, legs, result)
+        return result
+
+    def _build_frame(
+        self,
+        position: str,
+        symbols: list[tuple[str, float]],
+        total_weight: float,
+        raw: dict[str, list[dict]],
+    ) -> pd.DataFrame:
+        """由各腿原始行构建 (close, daily_return) 日频数据"""
+        legs: dict[str, tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
         for sym, _weight in symbols:
-            data = self.db_api.get_continuous(sym, start_date=start_date, end_date=end_date, limit=limit)
+            data = raw.get(sym)
             if not data:
                 raise DataValidationError(f"无数据: {sym}")
-            df = pd.DataFrame(data)
-            required = {"trade_date", "close_ba"}
-            missing = required.difference(df.columns)
-            if missing:
-                raise DataValidationError(f"{sym} 缺少必需字段: {sorted(missing)}")
-
-            df["datetime"] = pd.to_datetime(df["trade_date"])
-            df = df.sort_values("datetime")
-            # Defensive: some upstreams may return duplicate trade_date rows; keep the last.
-            df = df.drop_duplicates(subset=["datetime"], keep="last")
-            close = df["close_ba"].astype(float)
-            ret = df["daily_return"].astype(float) if "daily_return" in df.columns else close.pct_change()
-            leg = pd.DataFrame({"close": close.values, "daily_return": ret.values}, index=df["datetime"])
-            leg = leg[~leg.index.duplicated(keep="last")].sort_index()
-            dfs[sym] = leg
+            legs[sym] = _leg_arrays(sym, data)
 
         # 单品种：直接用该品种数据（方向已在 weight 中体现）
         if len(symbols) == 1:
             sym, weight = symbols[0]
-            result = dfs[sym].copy()
-            result["daily_return"] = result["daily_return"] * (1.0 if weight > 0 else -1.0)
-            result = result.dropna()
-            result = result[~result.index.duplicated(keep="last")].sort_index()
-            return result
-
-        # 对冲头寸：按日期对齐
-        merged = None
-        for sym, weight in symbols:
-            df = dfs[sym].copy()
-            df = df.rename(columns={"close": f"close_{sym}", "daily_return": f"ret_{sym}"})
-            if merged is None:
-                merged = df
-            else:
-                merged = merged.join(df, how="inner")
-
-        if merged is None or len(merged) == 0:
+            dates, close, ret = legs[sym]
+            result = pd.DataFrame(
+                {"close": close, "daily_return": ret * (1.0 if weight > 0 else -1.0)},
+                index=pd.DatetimeIndex(dates, name="datetime"),
+            )
+            return result.dropna()
+
+        # 对冲头寸：按日期对齐（各腿日期已升序去重，取交集后按位置取值）
+        common = reduce(np.intersect1d, [legs[sym][0] for sym, _weight in symbols])
+        if len(common) == 0:
             raise DataValidationError(f"{position} 无法对齐两腿数据")
 
+        # One (n, 2 * legs) panel: leg closes in the first half, leg returns in the second.
+        k = len(symbols)
+        panel = np.empty((len(common), 2 * k))
+        for j, (sym, _weight) in enumerate(symbols):
+            dates, close, ret = legs[sym]
+            pos = np.searchsorted(dates, common)
+            panel[:, j] = close[pos]
+            panel[:, k + j] = ret[pos]
+
         # 组合收益：按合约价值比例（可近似为固定权重组合）
-        result = pd.DataFrame(index=merged.index)
-        result["daily_return"] = (
-            sum(merged[f"ret_{sym}"] * float(weight) for sym, weight in symbols) / total_weight
+        # 信号价格：用多头腿/空头腿的价格比值（更适合阈值类策略）；缺少多/空腿时退化为加权绝对价格和
+        weights = np.array([float(w) for _sym, w in symbols])
+        long_j = next((j for j, (_sym, w) in enumerate(symbols) if w > 0), -1)
+        short_j = next((j for j, (_sym, w) in enumerate(symbols) if w < 0), -1)
+        daily_return, close = combine_legs(panel, weights, float(total_weight), long_j, short_j)
+
+        result = pd.DataFrame(
+            {"daily_return": daily_return, "close": close}, index=pd.DatetimeIndex(common, name="datetime")
         )
+        return result.dropna()
 
-        # 信号价格：用多头腿/空头腿的价格比值（更适合阈值类策略）
-        long_leg = next(((sym, w) for sym, w in symbols if w > 0), None)
-        short_leg = next(((sym, w) for sym, w in symbols if w < 0), None)
-        if not long_leg or not short_leg:
-            # Fallback: 退化为加权绝对价格和
-            result["close"] = sum(merged[f"close_{sym}"] * abs(float(weight)) for sym, weight in symbols)
-        else:
-            long_sym, long_w = long_leg
-            short_sym, short_w = short_leg
-            num = merged[f"close_{long_sym}"] * abs(float(long_w))
-            den = merged[f"close_{short_sym}"] * abs(float(short_w))
-            result["close"] = (num / den).replace([np.inf, -np.inf], np.nan)
-
-        result = result.dropna()
-        result = result[~result.index.duplicated(keep="last")].sort_index()
-        return result
-
-    def _optimize_params(self, df: pd.DataFrame, *, direction: str, max_evals: int) -> dict:
+    def _optimize_params(
+        self,
+        df: pd.DataFrame,
+        inputs: tuple[np.ndarray, np.ndarray] | None,
+        *,
+        direction: str,
+        max_evals: int,
+    ) -> dict:
         """随机采样/小规模网格搜索参数优化（避免组合爆炸）"""
         if max_evals <= 0:
             return self._default_params()
@@ -324,72 +536,123 @@ class BacktestStrategySkill(BaseSkill):
         seed_src = f"{direction}|{df.index.min()}|{df.index.max()}".encode("utf-8")
         seed = int(hashlib.md5(seed_src).hexdigest()[:8], 16)
         rng = np.random.default_rng(seed)
-        best_sharpe = float("-inf")
-        best_params = None
-
-        for param_dict in self._iter_param_candidates(max_evals, rng):
-            metrics, _ = self._run_backtest(df, param_dict, direction=direction)
-            sharpe = float(metrics.get("sharpe_ratio", 0) or 0)
-            if sharpe > best_sharpe:
-                best_sharpe = sharpe
-                best_params = param_dict
+        keys, values_list, choice = self._param_candidates(max_evals, rng)
+        if not len(choice):
+            return self._default_params()
 
-        return best_params or self._default_params()
+        def candidate(row: int) -> dict:
+            return {k: _to_py(vs[i]) for k, vs, i in zip(keys, values_list, choice[row].tolist())}
+
+        if inputs is None:
+            # Every candidate scores the empty metrics (Sharpe 0); the first one wins.
+            return candidate(0)
+
+        # One float column per simulator parameter (grid values, or the default when not in the grid).
+        columns = {k: j for j, k in enumerate(keys)}
+        params = np.empty((len(choice), len(_SIM_PARAMS)), dtype=np.float64)
+        for c, (k, default) in enumerate(_SIM_PARAMS):
+            j = columns.get(k)
+            params[:, c] = default if j is None else np.asarray(values_list[j], dtype=np.float64)[choice[:, j]]
+
+        # Rows differing only in the other direction's thresholds simulate identically: score each
+        # distinct row once, at its first occurrence, so the argmax below still lands on the same row.
+        is_long = direction == "long"
+        used = [0, 2] if is_long else [1, 3]
+        used += range(4, len(_SIM_PARAMS))
+        _, first = np.unique(params[:, used], axis=0, return_index=True)
+        first.sort()
+
+        # Score the whole candidate grid in one call (compiled and threaded when numba is available).
+        rets, sig = inputs
+        sharpes = grid_sharpe(rets, sig, is_long, params[first], self._cost_rate())
+
+        # First strictly-best candidate wins, as in a sequential scan; NaN never wins.
+        sharpes = np.where(np.isnan(sharpes), -np.inf, sharpes)
+        best = int(np.argmax(sharpes))
+        if sharpes[best] == -np.inf:
+            return self._default_params()
+        return candidate(int(first[best]))
 
-    def _iter_param_candidates(self, max_evals: int, rng: np.random.Generator) -> Iterable[dict]:
+    def _param_candidates(
+        self, max_evals: int, rng: np.random.Generator
+    ) -> tuple[list[str], list[list], np.ndarray]:
+        """
+        参数候选：返回 (参数名, 各参数取值列表, (n, len(keys)) 取值下标矩阵)。
+        网格总数不超过 max_evals 时枚举全部组合；否则用加扰 Sobol 序列抽取 max_evals 组，
+        比逐个随机抽样更均匀地覆盖参数空间。
+        """
         keys = list(self.default_param_grid.keys())
         values_list = [list(self.default_param_grid[k]) for k in keys]
+        sizes = [max(1, len(v)) for v in values_list]
 
         total = 1
-        for v in values_list:
-            total *= max(1, len(v))
+        for n in sizes:
+            total *= n
 
         if total <= max_evals:
-            for combo in product(*values_list):
-                yield {k: _to_py(v) for k, v in zip(keys, combo)}
-            return
+            # Row-major over the grid: same order as itertools.product.
+            return keys, values_list, np.stack(np.unravel_index(np.arange(total), sizes), axis=1)
+
+        # Imported here: scipy.stats is heavy and only needed when the grid has to be sampled.
+        from scipy.stats import qmc
 
-        for _ in range(max_evals):
-            candidate = {}
-            for k, vs in zip(keys, values_list):
-                candidate[k] = _to_py(rng.choice(vs))
-            yield candidate
+        # Base-2 Sobol blocks keep the balance properties; use the first max_evals points.
+        m = max(0, int(max_evals - 1).bit_length())
+        points = qmc.Sobol(len(keys), scramble=True, seed=rng).random_base2(m)[:max_evals]
+        choice = np.minimum((points * sizes).astype(np.intp), np.asarray(sizes) - 1)
+        return keys, values_list, choice
 
     def _default_params(self) -> dict:
         # A deterministic fallback (use the first element of each grid).
         return {k: _to_py(list(v)[0]) for k, v in self.default_param_grid.items()}
 
-    def _run_backtest(self, df: pd.DataFrame, params: dict, *, direction: str) -> tuple[dict, pd.Series]:
-        """运行回测：阈值策略(基于 close 信号) -> exposure -> 组合 daily_return"""
+    def _strategy_inputs(self, df: pd.DataFrame) -> tuple[np.ndarray, np.ndarray] | None:
+        """(base_returns, signal) 的连续 float64 数组；缺少 daily_return/close 列时返回 None"""
         if "daily_return" not in df.columns or "close" not in df.columns:
+            return None
+        rets = df["daily_return"].to_numpy(dtype=np.float64, na_value=0.0)
+        sig = self._compute_signal(df["close"].astype(float))
+        return np.ascontiguousarray(rets), np.ascontiguousarray(sig)
+
+    def _run_backtest(
+        self,
+        index: pd.Index,
+        inputs: tuple[np.ndarray, np.ndarray] | None,
+        params: dict,
+        *,
+        direction: str,
+    ) -> tuple[dict, pd.Series]:
+        """运行回测：阈值策略(基于 close 信号) -> exposure -> 组合 daily_return"""
+        if inputs is None:
             return self._empty_metrics(), pd.Series(dtype=float)
 
-        base_returns = df["daily_return"].astype(float).fillna(0.0)
-        signal = self._compute_signal(df["close"].astype(float))
-        strategy_returns, n_trades = self._simulate_threshold_strategy(
-            base_returns=base_returns,
-            signal=signal,
+        rets, sig = inputs
+        out, n_trades = self._simulate_threshold_strategy(
+            rets=rets,
+            sig=sig,
             direction=direction,
             params=params or {},
         )
-
-        metrics = self._calculate_metrics(strategy_returns)
-        metrics["n_trades"] = int(n_trades)
-        return metrics, strategy_returns
-
-    def _compute_signal(self, close: pd.Series, window: int = 60) -> pd.Series:
-        ma = close.rolling(window=window, min_periods=max(5, window // 3)).mean()
+        result = self._calculate_metrics(out)
+        result["n_trades"] = int(n_trades)
+        return result, pd.Series(out, index=index, name="strategy_return")
+
+    def _compute_signal(self, close: pd.Series, window: int = 60) -> np.ndarray:
+        min_periods = max(5, window // 3)
+        if ma_signal is not None:
+            return ma_signal(close.to_numpy(dtype=np.float64), window, min_periods)
+        ma = close.rolling(window=window, min_periods=min_periods).mean()
         signal = (close / ma).replace([np.inf, -np.inf], np.nan)
-        return signal.bfill().fillna(1.0)
+        return signal.bfill().fillna(1.0).to_numpy(dtype=np.float64)
 
     def _simulate_threshold_strategy(
         self,
         *,
-        base_returns: pd.Series,
-        signal: pd.Series,
+        rets: np.ndarray,
+        sig: np.ndarray,
         direction: str,
         params: dict,
-    ) -> tuple[pd.Series, int]:
+    ) -> tuple[np.ndarray, int]:
         """
         A simple timing strategy:
           - long direction: enter when signal <= low_threshold, exit when signal >= reverse_long_threshold
@@ -403,117 +666,16 @@ class BacktestStrategySkill(BaseSkill):
           - profit_threshold_pct (trade-level take profit)
           - drawdown_threshold_pct (trade-level trailing drawdown)
         """
-        low_th = float(params.get("low_threshold", 1.02))
-        high_th = float(params.get("high_threshold", 1.45))
-        rev_long = float(params.get("reverse_long_threshold", 1.12))
-        rev_short = float(params.get("reverse_short_threshold", 1.08))
-        stop_loss = float(params.get("stop_loss_pct", 0.02))
-        th_step = float(params.get("threshold_adjust_pct", 0.05))
-        max_pos = float(params.get("max_position_pct", 1.0))
-        pos_step = float(params.get("position_increase_pct", 0.2))
-        take_profit = float(params.get("profit_threshold_pct", 0.2))
-        max_trade_dd = float(params.get("drawdown_threshold_pct", 0.3))
-
-        cost_rate = float(self.slippage) + float(self.commission_rate)
-
-        idx = base_returns.index
-        rets = base_returns.values
-        sig = signal.reindex(idx).fillna(1.0).values
-
-        exposure = 0.0
-        next_exposure = 0.0
-        entry_equity = 1.0
-        trade_peak = 1.0
-        trade_equity = 1.0
-        in_trade = False
-        n_trades = 0
-        n_adds = 0
-
-        out = np.zeros(len(idx), dtype=float)
-
-        def want_enter_long(s: float) -> bool:
-            return s <= low_th
-
-        def want_exit_long(s: float) -> bool:
-            return s >= rev_long
-
-        def want_enter_short(s: float) -> bool:
-            return s >= high_th
-
-        def want_exit_short(s: float) -> bool:
-            return s <= rev_short
-
-        for i in range(len(idx)):
-            # Apply today's return with yesterday's exposure (close->close convention).
-            out[i] = exposure * float(rets[i])
-
-            # Update trade equity for risk checks.
-            trade_equity *= (1.0 + out[i])
-            if in_trade:
-                trade_peak = max(trade_peak, trade_equity)
-
-            # Decide next exposure based on today's signal (trade at close).
-            s = float(sig[i])
-            next_exposure = exposure
-
-            if direction == "long":
-                if not in_trade and want_enter_long(s):
-                    next_exposure = min(max_pos, pos_step)
-                    in_trade = True
-                    n_trades += 1
-                    n_adds = 0
-                    entry_equity = trade_equity
-                    trade_peak = trade_equity
-                elif in_trade:
-                    # Scale in if signal moves further down in steps.
-                    add_level = low_th - th_step * (n_adds + 1)
-                    if s <= add_level and next_exposure < max_pos:
-                        next_exposure = min(max_pos, next_exposure + pos_step)
-                        n_adds += 1
-
-                    trade_ret = trade_equity / entry_equity - 1.0
-                    trade_dd = trade_equity / trade_peak - 1.0 if trade_peak else 0.0
-                    if (
-                        want_exit_long(s)
-                        or trade_ret <= -stop_loss
-                        or trade_ret >= take_profit
-                        or trade_dd <= -max_trade_dd
-                    ):
-                        next_exposure = 0.0
-                        in_trade = False
-            else:  # short
-                if not in_trade and want_enter_short(s):
-                    next_exposure = min(max_pos, pos_step)
-                    in_trade = True
-                    n_trades += 1
-                    n_adds = 0
-                    entry_equity = trade_equity
-                    trade_peak = trade_equity
-                elif in_trade:
-                    add_level = high_th + th_step * (n_adds + 1)
-                    if s >= add_level and next_exposure < max_pos:
-                        next_exposure = min(max_pos, next_exposure + pos_step)
-                        n_adds += 1
-
-                    trade_ret = trade_equity / entry_equity - 1.0
-                    trade_dd = trade_equity / trade_peak - 1.0 if trade_peak else 0.0
-                    if (
-                        want_exit_short(s)
-                        or trade_ret <= -stop_loss
-                        or trade_ret >= take_profit
-                        or trade_dd <= -max_trade_dd
-                    ):
-                        next_exposure = 0.0
-                        in_trade = False
-
-            # Transaction cost when adjusting exposure (charged on decision day).
-            delta = abs(next_exposure - exposure)
-            if delta:
-                out[i] -= delta * cost_rate
-
-            exposure = next_exposure
-
-        return pd.Series(out, index=idx, name="strategy_return"), n_trades
+        return simulate(
+            rets,
+            sig,
+            direction == "long",
+            *(float(params.get(k, d)) for k, d in _SIM_PARAMS),
+            self._cost_rate(),
+        )
+
+    def _cost_rate(self) -> float:
+        return float(self.slippage) + float(self.commission_rate)
 
     def _empty_metrics(self) -> dict:
         return {
@@ -525,27 +687,19 @@ class BacktestStrategySkill(BaseSkill):
             "n_days": 0,
         }
 
-    def _calculate_metrics(self, returns: pd.Series) -> dict:
-        returns = returns.dropna()
+    def _calculate_metrics(self, returns: np.ndarray) -> dict:
+        returns = returns[~np.isnan(returns)]
         if len(returns) < 2:
             return self._empty_metrics()
 
-        cum = (1.0 + returns).cumprod()
-        total_return = float(cum.iloc[-1] - 1.0)
-
-        n = len(returns)
-        annualized_return = float((1.0 + total_return) ** (252.0 / n) - 1.0) if n > 0 else 0.0
-        vol = float(returns.std(ddof=0) * np.sqrt(252.0))
-        sharpe = float((returns.mean() / returns.std(ddof=0)) * np.sqrt(252.0)) if returns.std(ddof=0) != 0 else 0.0
-
-        peak = cum.cummax()
-        max_dd = float((cum / peak - 1.0).min())
+        # Same one-pass kernel as the portfolio skill (numba when available, numpy otherwise).
+        sharpe, total_return, max_dd, annualized_return, vol, n = metrics(returns)
 
         return {
-            "sharpe_ratio": sharpe,
-            "total_return": total_return,
-            "max_drawdown": max_dd,
-            "annualized_return": annualized_return,
-            "annualized_volatility": vol,
+            "sharpe_ratio": float(sharpe),
+            "total_return": float(total_return),
+            "max_drawdown": float(max_dd),
+            "annualized_return": float(annualized_return),
+            "annualized_volatility": float(vol),
             "n_days": int(n),
         }
@@ -1,16 +1,32 @@
+import logging
+import math
 import os
 from datetime import datetime
+from typing import TYPE_CHECKING
+import numpy as np
 import pandas as pd
-import json
-
-# Force a headless-friendly backend (common in servers/CI).
-import matplotlib
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
 
+from backtest_system.core import _json
 from backtest_system.skills.base import BaseSkill
 from backtest_system.core.models import SkillResult
 
+logger = logging.getLogger(__name__)
+
+# matplotlib is imported on the first chart render, so processes that never draw a chart skip its
+# import cost. Charts use a bare Figure (no pyplot), which renders headless without selecting a backend.
+if TYPE_CHECKING:
+    from matplotlib.figure import Figure
+
+try:
+    import xlsxwriter  # noqa: F401  (write-only engine: streams rows instead of building a workbook DOM)
+    _EXCEL_ENGINE = "xlsxwriter"
+except ImportError:  # fall back to openpyxl
+    _EXCEL_ENGINE = "openpyxl"
+
+# Metric columns shared by the Strategies and Portfolios sheets, in sheet order.
+_METRIC_COLUMNS = ("sharpe_ratio", "annualized_return", "annualized_volatility", "max_drawdown", "total_return")
+
+
 class GenerateReportSkill(BaseSkill):
     """报告生成Skill - 只做报告生成，不做计算"""
 
@@ -18,6 +34,9 @@ class GenerateReportSkill(BaseSkill):
         self.db_api = db_api
         self.output_dir = output_dir
         os.makedirs(output_dir, exist_ok=True)
+        # One chart figure per skill, created on first use and cleared between renders. A bare
+        # Figure is not registered with pyplot, so it needs no close() and is freed with the skill.
+        self._fig: "Figure | None" = None
 
     @property
     def name(self) -> str:
@@ -26,17 +45,29 @@ class GenerateReportSkill(BaseSkill):
     def execute(self, results: dict, top_n: int = 10) -> SkillResult:
         """生成报告"""
         try:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            task_id = results.get("task_id", timestamp)
+            # One clock read per report: the Summary sheet and the DB record share the timestamp.
+            now = datetime.now()
+            now_iso = now.isoformat()
+            task_id = results.get("task_id", now.strftime("%Y%m%d_%H%M%S"))
+
+            # Resolve the portfolio step once; the Excel, chart and DB writers all read from it.
+            steps = results.get("steps", []) or []
+            port_step = next((s for s in steps if s.get("skill") == "backtest_portfolio"), None)
+            port_data = {}
+            if port_step and port_step.get("result") and getattr(port_step["result"], "data", None):
+                port_data = port_step["result"].data or {}
+            best = port_data.get("best") or {}
 
             # 生成Excel报告
-            excel_path = self._generate_excel(results, task_id, top_n=top_n)
+            excel_path = self._generate_excel(
+                results, task_id, top_n=top_n, port_data=port_data, now_iso=now_iso
+            )
 
             # 生成可视化图表
-            charts = self._generate_charts(results, task_id)
+            charts = self._generate_charts(best, task_id)
 
             # 记录到数据库
-            db_record_id = self._save_to_db(results, excel_path, task_id)
+            db_record_id = self._save_to_db(best, excel_path, task_id, now_iso=now_iso)
 
             return SkillResult(
                 success=True,
@@ -49,18 +80,24 @@ class GenerateReportSkill(BaseSkill):
         except Exception as e:
             return SkillResult(success=False, error=str(e))
 
-    def _generate_excel(self, results: dict, task_id: str, *, top_n: int = 10) -> str:
-        """生成Excel报告"""
+    def _generate_excel(
+        self, results: dict, task_id: str, *, top_n: int = 10, port_data: dict, now_iso: str
+    ) -> str:
+        """生成Excel报告；port_data 为组合回测步骤的结果数据（无则为空 dict），now_iso 为报告时间"""
         excel_path = os.path.join(self.output_dir, f"{task_id}.xlsx")
+        # Row loops below run once per period/combo: keep their lookups local (LOAD_FAST).
+        dumps = _json.dumps
+        strat_metrics = _METRIC_COLUMNS + ("n_trades", "n_days")
+        port_metrics = _METRIC_COLUMNS + ("n_days",)
 
-        with pd.ExcelWriter(excel_path, engine='openpyxl') as writer:
+        with pd.ExcelWriter(excel_path, engine=_EXCEL_ENGINE) as writer:
             cfg = results.get("config") or {}
 
             # Summary
             summary_rows = [
                 {"key": "task_id", "value": task_id},
                 {"key": "mode", "value": results.get("mode")},
-                {"key": "timestamp", "value": datetime.now().isoformat()},
+                {"key": "timestamp", "value": now_iso},
                 {"key": "positions", "value": ",".join((cfg.get("positions") or []))},
                 {"key": "periods", "value": ",".join((cfg.get("periods") or []))},
                 {"key": "combo_range", "value": str(cfg.get("combo_range"))},
@@ -72,33 +109,38 @@ class GenerateReportSkill(BaseSkill):
 
             steps = results.get("steps", []) or []
 
-            # Steps
-            steps_data = []
-            for step in steps:
-                r = step.get("result")
-                steps_data.append({
-                    "skill": step.get("skill"),
-                    "position": step.get("position", ""),
-                    "success": bool(getattr(r, "success", False)) if r is not None else False,
-                    "error": getattr(r, "error", None) if r is not None else None,
-                })
-            pd.DataFrame(steps_data).to_excel(writer, sheet_name="Steps", index=False)
+            # Steps (sheets are built column-wise: one list per column, not one dict per row).
+            # Sheets with no rows are skipped; Summary is always written.
+            step_results = [step.get("result") for step in steps]
+            steps_data = {
+                "skill": [step.get("skill") for step in steps],
+                "position": [step.get("position", "") for step in steps],
+                "success": [bool(getattr(r, "success", False)) if r is not None else False for r in step_results],
+                "error": [getattr(r, "error", None) if r is not None else None for r in step_results],
+            }
+            if steps:
+                pd.DataFrame(steps_data).to_excel(writer, sheet_name="Steps", index=False)
 
             # Validation details
             validate = next((s for s in steps if s.get("skill") == "validate_data"), None)
             if validate and validate.get("result") and getattr(validate["result"], "data", None):
                 vdata = validate["result"].data or {}
-                rows = []
-                for p in vdata.get("passed", []) or []:
-                    rows.append({"position": p, "status": "pass", "message": ""})
-                for w in vdata.get("warnings", []) or []:
-                    rows.append({"position": w.get("position"), "status": "warning", "message": w.get("message")})
-                for f in vdata.get("failed", []) or []:
-                    rows.append({"position": f.get("position"), "status": "fail", "message": f.get("message")})
-                pd.DataFrame(rows).to_excel(writer, sheet_name="Validation", index=False)
+                passed = vdata.get("passed", []) or []
+                warnings = vdata.get("warnings", []) or []
+                failed = vdata.get("failed", []) or []
+                rows = {
+                    "position": passed + [w.get("position") for w in warnings] + [f.get("position") for f in failed],
+                    "status": ["pass"] * len(passed) + ["warning"] * len(warnings) + ["fail"] * len(failed),
+                    "message": [""] * len(passed) + [w.get("message") for w in warnings] + [f.get("message") for f in failed],
+                }
+                if rows["position"]:
+                    pd.DataFrame(rows).to_excel(writer, sheet_name="Validation", index=False)
 
             # Strategy results (flatten per period)
-            strat_rows = []
+            strat_rows: dict[str, list] = {
+                k: [] for k in ("position", "direction", "period", "is_best_period") + _METRIC_COLUMNS
+                + ("n_trades", "n_days", "best_params")
+            }
             for step in steps:
                 if step.get("skill") != "backtest_strategy" or not step.get("result"):
                     continue
@@ -112,77 +154,66 @@ class GenerateReportSkill(BaseSkill):
                 if isinstance(pr, dict):
                     for period, item in pr.items():
                         m = (item or {}).get("metrics") or {}
-                        strat_rows.append({
-                            "position": pos,
-                            "direction": direction,
-                            "period": period,
-                            "is_best_period": period == best_period,
-                            "sharpe_ratio": m.get("sharpe_ratio"),
-                            "annualized_return": m.get("annualized_return"),
-                            "annualized_volatility": m.get("annualized_volatility"),
-                            "max_drawdown": m.get("max_drawdown"),
-                            "total_return": m.get("total_return"),
-                            "n_trades": m.get("n_trades"),
-                            "n_days": m.get("n_days"),
-                            "best_params": json.dumps((item or {}).get("best_params") or {}, ensure_ascii=True),
-                        })
-            if strat_rows:
-                pd.DataFrame(strat_rows).to_excel(writer, sheet_name="Strategies", index=False)
+                        strat_rows["position"].append(pos)
+                        strat_rows["direction"].append(direction)
+                        strat_rows["period"].append(period)
+                        strat_rows["is_best_period"].append(period == best_period)
+                        for k in strat_metrics:
+                            strat_rows[k].append(m.get(k))
+                        strat_rows["best_params"].append(
+                            dumps((item or {}).get("best_params") or {})
+                        )
+            if strat_rows["position"]:
+                _write_columns(writer, "Strategies", strat_rows)
 
             # Portfolio results (top-N per period)
-            port_step = next((s for s in steps if s.get("skill") == "backtest_portfolio"), None)
-            if port_step and port_step.get("result") and getattr(port_step["result"], "data", None):
-                pdata = port_step["result"].data or {}
-                period_results = pdata.get("period_results") or {}
-                port_rows = []
+            if port_data:
+                period_results = port_data.get("period_results") or {}
+                port_rows: dict[str, list] = {
+                    k: [] for k in ("period", "rank", "model", "positions") + _METRIC_COLUMNS + ("n_days", "weights")
+                }
                 for period, item in period_results.items():
                     top = (item or {}).get("top") or []
                     for rank, entry in enumerate(top[:top_n], start=1):
                         m = (entry or {}).get("metrics") or {}
-                        port_rows.append({
-                            "period": period,
-                            "rank": rank,
-                            "model": entry.get("model"),
-                            "positions": ",".join(entry.get("positions") or []),
-                            "sharpe_ratio": m.get("sharpe_ratio"),
-                            "annualized_return": m.get("annualized_return"),
-                            "annualized_volatility": m.get("annualized_volatility"),
-                            "max_drawdown": m.get("max_drawdown"),
-                            "total_return": m.get("total_return"),
-                            "n_days": m.get("n_days"),
-                            "weights": json.dumps(entry.get("weights") or {}, ensure_ascii=True),
-                        })
-                if port_rows:
-                    pd.DataFrame(port_rows).to_excel(writer, sheet_name="Portfolios", index=False)
+                        port_rows["period"].append(period)
+                        port_rows["rank"].append(rank)
+                        port_rows["model"].append(entry.get("model"))
+                        port_rows["positions"].append(",".join(entry.get("positions") or []))
+                        for k in port_metrics:
+                            port_rows[k].append(m.get(k))
+                        port_rows["weights"].append(dumps(entry.get("weights") or {}))
+                if port_rows["period"]:
+                    _write_columns(writer, "Portfolios", port_rows)
 
         return excel_path
 
-    def _generate_charts(self, results: dict, task_id: str) -> list:
-        """生成可视化图表"""
+    def _generate_charts(self, best: dict, task_id: str) -> list:
+        """生成可视化图表（best 为最优组合结果）"""
         charts: list[str] = []
-        steps = results.get("steps", []) or []
-        port_step = next((s for s in steps if s.get("skill") == "backtest_portfolio"), None)
-        if not (port_step and port_step.get("result") and getattr(port_step["result"], "data", None)):
-            return charts
-
-        best = (port_step["result"].data or {}).get("best") or {}
         rets = best.get("portfolio_returns") or []
         dates = best.get("dates") or []
         if not rets or not dates or len(rets) != len(dates):
             return charts
 
         try:
-            idx = pd.to_datetime(pd.Series(dates))
-            s = pd.Series(rets, index=idx, dtype=float)
-            equity = (1.0 + s).cumprod()
+            # Dates are ISO strings from the portfolio skill; numpy parses them without a pandas index.
+            idx = np.asarray(dates, dtype="datetime64[ns]")
+            equity = np.asarray(rets, dtype=np.float64) + 1.0
+            np.cumprod(equity, out=equity)
 
             path = os.path.join(self.output_dir, f"{task_id}_equity.png")
-            plt.figure(figsize=(10, 4))
-            plt.plot(equity.index, equity.values)
-            plt.title(f"Equity Curve ({best.get('period')}, {best.get('model')})")
-            plt.tight_layout()
-            plt.savefig(path)
-            plt.close()
+            if self._fig is None:
+                from matplotlib.figure import Figure
+
+                self._fig = Figure(figsize=(10, 4))
+            # Fresh axes each time: tight_layout would otherwise start from the previous layout.
+            self._fig.clear()
+            ax = self._fig.add_subplot()
+            ax.plot(idx, equity)
+            ax.set_title(f"Equity Curve ({best.get('period')}, {best.get('model')})")
+            self._fig.tight_layout()
+            self._fig.savefig(path)
             charts.append(path)
         except Exception:
             # Charts are optional; ignore.
@@ -190,17 +221,11 @@ class GenerateReportSkill(BaseSkill):
 
         return charts
 
-    def _save_to_db(self, results: dict, excel_path: str, task_id: str) -> int:
-        """记录到数据库"""
+    def _save_to_db(self, best: dict, excel_path: str, task_id: str, *, now_iso: str) -> int:
+        """记录到数据库（best 为最优组合结果，now_iso 为报告时间）"""
         if not self.db_api:
             return 0
 
-        steps = results.get("steps", []) or []
-        port_step = next((s for s in steps if s.get("skill") == "backtest_portfolio"), None)
-        best = {}
-        if port_step and port_step.get("result") and getattr(port_step["result"], "data", None):
-            best = (port_step["result"].data or {}).get("best") or {}
-
         period = best.get("period") or "unknown"
         metrics = best.get("metrics") or {}
         positions = best.get("positions") or []
@@ -215,12 +240,30 @@ class GenerateReportSkill(BaseSkill):
             "task_id": task_id,
             "result_type": "portfolio",
             "period": period,
-            "metrics": json.dumps(metrics_payload, ensure_ascii=True) if metrics_payload else "{}",
+            "metrics": _json.dumps(metrics_payload) if metrics_payload else "{}",
             "excel_path": excel_path,
-            "created_at": datetime.now().isoformat()
+            "created_at": now_iso
         }
         try:
             return self.db_api.write_result(record)
         except Exception as e:
-            print(f"结果写入数据库失败: {e}")
+            logger.warning(f"结果写入数据库失败: {e}")
             return 0
+
+
+def _write_columns(writer: pd.ExcelWriter, sheet_name: str, columns: dict[str, list]) -> None:
+    """按列数据写一张表：xlsxwriter 引擎下逐行直接写入工作表（不经 DataFrame），否则用 to_excel"""
+    if _EXCEL_ENGINE != "xlsxwriter":
+        pd.DataFrame(columns).to_excel(writer, sheet_name=sheet_name, index=False)
+        return
+    ws = writer.book.add_worksheet(sheet_name)
+    ws.write_row(0, 0, list(columns))
+    for i, row in enumerate(zip(*columns.values()), start=1):
+        ws.write_row(i, 0, [_excel_cell(v) for v in row])
+
+
+def _excel_cell(v):
+    # Match to_excel's defaults: NaN -> empty cell, +/-inf -> "inf"/"-inf" (xlsxwriter rejects both).
+    if isinstance(v, float) and not math.isfinite(v):
+        return None if math.isnan(v) else ("inf" if v > 0 else "-inf")
+    return v
@@ -32,9 +32,14 @@ class ValidateDataSkill(BaseSkill):
                     deltas.append(d)
             max_delta = max(deltas) if deltas else None
 
+        start_date, end_date = self._check_window(max_delta)
+        rows = self._prefetch(positions, start_date=start_date, end_date=end_date)
+
         for position in positions:
             try:
-                result = self._validate_position(position, max_delta=max_delta)
+                result = self._validate_position(
+                    position, max_delta=max_delta, start_date=start_date, end_date=end_date, rows=rows
+                )
                 if result["status"] == "pass":
                     passed.append(position)
                 elif result["status"] == "warning":
@@ -61,32 +66,60 @@ class ValidateDataSkill(BaseSkill):
             data={"passed": passed, "failed": failed, "warnings": warnings},
         )
 
-    def _validate_position(self, position: str, *, max_delta) -> dict:
-        """验证头寸数据（解析头寸格式，检查各品种数据）"""
-        parsed = parse_position(position)
-        symbols = [sym for sym, _ in parsed['symbols']]
-
+    @staticmethod
+    def _check_window(max_delta) -> tuple[str, str]:
+        """检查窗口 (start_date, end_date)，所有头寸共用"""
         # If a max period is provided, verify we have data near the start boundary.
         today = date.today()
         if max_delta is not None:
             start = today - max_delta
             # A small window near the boundary is enough to prove the history exists.
             window_end = start + timedelta(days=45)
-            start_date = start.isoformat()
-            end_date = window_end.isoformat()
-        else:
-            # Fallback: just check recent ~1y.
-            start_date = (today - timedelta(days=365)).isoformat()
-            end_date = today.isoformat()
+            return start.isoformat(), window_end.isoformat()
+        # Fallback: just check recent ~1y.
+        return (today - timedelta(days=365)).isoformat(), today.isoformat()
+
+    def _prefetch(self, positions: list[str], *, start_date: str, end_date: str) -> dict[str, list[dict]] | None:
+        """一次批量读取所有头寸涉及的品种；批量请求失败时返回 None（逐品种读取并分别归类错误）"""
+        symbols = []
+        for position in positions:
+            try:
+                symbols.extend(sym for sym, _ in parse_position(position)['symbols'])
+            except Exception:
+                continue  # reported by _validate_position
+        if not symbols:
+            return None
+        try:
+            return self.db_api.get_continuous_many(symbols, start_date=start_date, end_date=end_date, limit=10000)
+        except NetworkError:
+            raise
+        except Exception:
+            return None
+
+    def _validate_position(
+        self,
+        position: str,
+        *,
+        max_delta,
+        start_date: str,
+        end_date: str,
+        rows: dict[str, list[dict]] | None = None,
+    ) -> dict:
+        """验证头寸数据（解析头寸格式，检查各品种数据）；rows 为已批量读取的 {品种: rows}"""
+        parsed = parse_position(position)
+        symbols = [sym for sym, _ in parsed['symbols']]
 
         min_count = float("inf")
         for sym in symbols:
-            try:
-                data = self.db_api.get_continuous(sym, start_date=start_date, end_date=end_date, limit=10000)
-            except NetworkError:
-                raise
-            except Exception as e:
-                return {"status": "fail", "message": f"API请求失败 {sym}: {e}"}
+            if rows is not None and sym in rows:
+                data = rows[sym]
+            else:
+                try:
+                    data = self.db_api.get_continuous(sym, start_date=start_date, end_date=end_date, limit=10000)
+                except NetworkError:
+                    raise
+                except Exception as e:
+                    return {"status": "fail", "message": f"API请求失败 {sym}: {e}"}
 
             if not data:
                 if max_delta is not None:
@@ -1,48 +1,165 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import FileResponse
+from contextlib import asynccontextmanager
+from datetime import date, datetime, time
+from collections import OrderedDict
+from decimal import Decimal
+import hashlib
+import threading
+from time import monotonic
+
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import FileResponse, JSONResponse, Response
 import os
 
+from backtest_system.core import _json
+from backtest_system.core._envcache import env
 from backtest_system.core.config import load_config
 from backtest_system.core.database import DatabaseAPI
 
-app = FastAPI(title="回测系统", description="自动策略回测系统Web接口")
+_CFG = load_config(env("BACKTEST_CONFIG"))
+# Request handlers run on a thread pool; each read checks out its own pooled connection.
+_DB = DatabaseAPI(_CFG.database.url, _CFG.api, pool_size=_CFG.database.pool_size)
 
-_CFG = load_config(os.getenv("BACKTEST_CONFIG"))
-_DB = DatabaseAPI(_CFG.database.url, _CFG.api)
+@asynccontextmanager
+async def _lifespan(_app: FastAPI):
+    yield
+    _DB.close()
 
-@app.get("/api/tasks")
-def list_tasks(limit: int = 20):
-    """获取任务列表"""
-    if not _CFG.database.url:
-        raise HTTPException(status_code=503, detail="BACKTEST_DB_URL is not configured")
-    rows = _DB.read("SELECT * FROM backtest_tasks ORDER BY created_at DESC LIMIT %s", (limit,))
-    return {"tasks": rows, "total": len(rows)}
+app = FastAPI(title="回测系统", description="自动策略回测系统Web接口", lifespan=_lifespan)
+
+def _json_default(obj):
+    # DB values orjson/json don't encode natively, rendered the way jsonable_encoder would.
+    if isinstance(obj, Decimal):
+        return int(obj) if obj.as_tuple().exponent >= 0 else float(obj)
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    return str(obj)
+
+class _RowsResponse(JSONResponse):
+    """DB 行直接序列化为 JSON（安装 orjson 时使用 orjson），跳过 jsonable_encoder 的逐值遍历"""
+
+    def render(self, content) -> bytes:
+        return _json.dumps_bytes(content, default=_json_default)
+
+# Upper bound on one page of /api/tasks; a larger ?limit= is rejected (422) rather than letting
+# the DB sort the whole table.
+_MAX_TASKS_LIMIT = 200
 
-@app.get("/api/tasks/{task_id}")
-def get_task(task_id: str):
-    """获取任务详情"""
+@app.get("/api/tasks", response_class=_RowsResponse)
+def list_tasks(
+    limit: int = Query(20, ge=1, le=_MAX_TASKS_LIMIT),
+    after: datetime | None = None,
+    after_task_id: str | None = None,
+):
+    """获取任务列表（按创建时间倒序；翻页时传入上一页 next_cursor 的 created_at / task_id 作为 after / after_task_id）"""
     if not _CFG.database.url:
         raise HTTPException(status_code=503, detail="BACKTEST_DB_URL is not configured")
+    if (after is None) != (after_task_id is None):
+        raise HTTPException(status_code=400, detail="after and after_task_id must be given together")
+    # Keyset pagination: deep pages seek on the (created_at, task_id) index instead of scanning past
+    # an OFFSET. created_at has one-second resolution, so task_id breaks ties within a second.
+    if after is None:
+        rows = _DB.read(
+            "SELECT * FROM backtest_tasks ORDER BY created_at DESC, task_id DESC LIMIT %s", (limit,)
+        )
+    else:
+        rows = _DB.read(
+            "SELECT * FROM backtest_tasks WHERE (created_at, task_id) < (%s, %s) "
+            "ORDER BY created_at DESC, task_id DESC LIMIT %s",
+            (after, after_task_id, limit),
+        )
+    next_cursor = None
+    if len(rows) == limit:
+        next_cursor = {"created_at": rows[-1]["created_at"], "task_id": rows[-1]["task_id"]}
+    return _RowsResponse({"tasks": rows, "total": len(rows), "next_cursor": next_cursor})
+
+# task_id -> (stored at, body, etag) of finished tasks, LRU-ordered. Tasks are written by the CLI
+# process, which can't invalidate this cache, so only rows past "running" are kept, for a short TTL.
+_TASK_CACHE: "OrderedDict[str, tuple[float, bytes, str]]" = OrderedDict()
+_TASK_CACHE_LOCK = threading.Lock()
+_TASK_CACHE_SIZE = 1024
+_TASK_CACHE_TTL = 60.0
+
+def _fetch_task(task_id: str) -> tuple[bytes, str] | None:
+    """任务行渲染后的 (JSON 正文, ETag)；任务不存在时返回 None"""
+    now = monotonic()
+    with _TASK_CACHE_LOCK:
+        cached = _TASK_CACHE.get(task_id)
+        if cached is not None and now - cached[0] <= _TASK_CACHE_TTL:
+            _TASK_CACHE.move_to_end(task_id)
+            return cached[1], cached[2]
     rows = _DB.read("SELECT * FROM backtest_tasks WHERE task_id = %s LIMIT 1", (task_id,))
     if not rows:
+        return None
+    body = _json.dumps_bytes(rows[0], default=_json_default)
+    # The table has no updated_at; a digest of the row itself changes whenever any column does.
+    etag = f'"{hashlib.md5(body).hexdigest()}"'
+    if rows[0].get("status") != "running":
+        with _TASK_CACHE_LOCK:
+            _TASK_CACHE[task_id] = (now, body, etag)
+            _TASK_CACHE.move_to_end(task_id)
+            while len(_TASK_CACHE) > _TASK_CACHE_SIZE:
+                _TASK_CACHE.popitem(last=False)
+    return body, etag
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    # If-None-Match is "*" or a comma-separated list of tags, compared weakly (W/ prefix ignored).
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
+
+@app.get("/api/tasks/{task_id}", response_class=_RowsResponse)
+def get_task(task_id: str, request: Request):
+    """获取任务详情（支持 If-None-Match 条件请求，未变化时返回 304）"""
+    if not _CFG.database.url:
+        raise HTTPException(status_code=503, detail="BACKTEST_DB_URL is not configured")
+    entry = _fetch_task(task_id)
+    if entry is None:
         raise HTTPException(status_code=404, detail="Task not found")
-    return rows[0]
+    body, etag = entry
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(body, media_type="application/json", headers={"ETag": etag})
 
-@app.get("/api/tasks/{task_id}/logs")
+@app.get("/api/tasks/{task_id}/logs", response_class=_RowsResponse)
 def get_task_logs(task_id: str):
     """获取任务执行日志"""
     if not _CFG.database.url:
         raise HTTPException(status_code=503, detail="BACKTEST_DB_URL is not configured")
     rows = _DB.read("SELECT * FROM task_logs WHERE task_id = %s ORDER BY created_at ASC", (task_id,))
-    return {"task_id": task_id, "logs": rows}
+    return _RowsResponse({"task_id": task_id, "logs": rows})
+
+_XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
 
 @app.get("/api/reports/{task_id}/download")
 def download_report(task_id: str):
     """下载Excel报告"""
-    path = os.path.join(_CFG.app.output_dir, f"{task_id}.xlsx")
-    if os.path.exists(path):
-        return FileResponse(path, filename=f"{task_id}.xlsx", media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
-    raise HTTPException(status_code=404, detail="Report not found")
+    filename = f"{task_id}.xlsx"
+    path = os.path.join(_CFG.app.output_dir, filename)
+    try:
+        stat_result = os.stat(path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Report not found")
+    if _CFG.app.report_xaccel_prefix:
+        # nginx serves the file from its internal location (sendfile); the worker only sends headers.
+        return Response(
+            media_type=_XLSX_MEDIA_TYPE,
+            headers={
+                "X-Accel-Redirect": f"{_CFG.app.report_xaccel_prefix}/{filename}",
+                "Content-Disposition": f'attachment; filename="{filename}"',
+            },
+        )
+    # The stat above is passed on so Starlette doesn't stat the file again.
+    return FileResponse(
+        path,
+        filename=filename,
+        media_type=_XLSX_MEDIA_TYPE,
+        stat_result=stat_result,
+        content_disposition_type="attachment",
+    )
 
 @app.get("/api/health")
 def health_check():